@@ -0,0 +1,181 @@
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from models import SleepRecord
+from repository import sleep_records
+from stats import Summary
+
+# Rolling windows kept up to date for every loaded user, in days
+ROLLING_WINDOWS = (7, 30, 90, 365)
+# Number of users whose aggregates are kept in memory, others are rebuilt on use
+AGGREGATES_CACHE_SIZE = int(os.environ.get("AGGREGATES_CACHE_SIZE", "10000"))
+
+
+@dataclass(slots=True)
+class Totals:
+    """Running sums over a set of submitted records."""
+
+    count: int = 0
+    duration: int = 0  # seconds
+    energy: int = 0
+    clarity: int = 0
+
+    @classmethod
+    def from_record(cls, record: SleepRecord) -> "Totals":
+        return cls(
+            count=1,
+            duration=int(record.duration.total_seconds()),
+            energy=record.energy_score,
+            clarity=record.clarity_score,
+        )
+
+    def add(self, other: "Totals", sign: int = 1):
+        self.count += sign * other.count
+        self.duration += sign * other.duration
+        self.energy += sign * other.energy
+        self.clarity += sign * other.clarity
+
+    def summary(self) -> Summary | None:
+        if not self.count:
+            return None
+        return Summary(
+            count=self.count,
+            avg_duration=self.duration / self.count,
+            avg_energy=self.energy / self.count,
+            avg_clarity=self.clarity / self.count,
+        )
+
+
+@dataclass(slots=True)
+class _Window:
+    days: int
+    end: date | None = None
+    totals: Totals = field(default_factory=Totals)
+
+    def contains(self, day: date) -> bool:
+        return self.end is not None and 0 <= (self.end - day).days < self.days
+
+
+class UserAggregates:
+    """Totals of one user's submitted records, all time and over rolling windows.
+
+    Each record is kept as a daily bucket for as long as it can fall inside a
+    window. Windows slide forward one day at a time by adding the day entering and
+    subtracting the day leaving, so a lookup costs O(1) amortised.
+    """
+
+    def __init__(self, windows=ROLLING_WINDOWS):
+        self.all_time = Totals()
+        self.buckets: dict[date, Totals] = {}
+        self.windows = {days: _Window(days) for days in windows}
+        self._horizon = max(windows)
+
+    def apply(self, day: date, old: Totals | None, new: Totals | None):
+        """Replace the bucket for `day`, old being its previously counted value."""
+        for totals, sign in ((old, -1), (new, 1)):
+            if totals is None:
+                continue
+            self.all_time.add(totals, sign)
+            for window in self.windows.values():
+                if window.contains(day):
+                    window.totals.add(totals, sign)
+        if new is None:
+            self.buckets.pop(day, None)
+        else:
+            self.buckets[day] = new
+
+    def window(self, days: int, end: date) -> Totals:
+        """Return totals for the `days` days up to and including `end`."""
+        window = self.windows[days]
+        if window.end is None or end < window.end or (end - window.end).days >= days:
+            window.totals = Totals()
+            for day, totals in self.buckets.items():
+                if 0 <= (end - day).days < days:
+                    window.totals.add(totals)
+        else:
+            for offset in range(1, (end - window.end).days + 1):
+                entering = window.end + timedelta(days=offset)
+                leaving = entering - timedelta(days=days)
+                if entering in self.buckets:
+                    window.totals.add(self.buckets[entering])
+                if leaving in self.buckets:
+                    window.totals.add(self.buckets[leaving], -1)
+        window.end = end
+        self._prune()
+        return window.totals
+
+    def _prune(self):
+        # Buckets older than the longest window can no longer enter or leave one
+        ends = [window.end for window in self.windows.values()]
+        if None in ends:
+            return
+        cutoff = min(ends) - timedelta(days=self._horizon)
+        if any(day <= cutoff for day in self.buckets):
+            self.buckets = {d: t for d, t in self.buckets.items() if d > cutoff}
+
+    def matches(self, other: "UserAggregates", end: date) -> bool:
+        """Whether both hold the same totals, all time and in every window to end."""
+        return self.all_time == other.all_time and all(
+            self.window(days, end) == other.window(days, end) for days in self.windows
+        )
+
+
+class AggregateStore:
+    """Per-user aggregates, built from `sleep_records` on first use."""
+
+    def __init__(self, max_users=AGGREGATES_CACHE_SIZE):
+        self.max_users = max_users
+        self._users: OrderedDict[int, UserAggregates] = OrderedDict()
+
+    async def get(self, user_id: int) -> UserAggregates:
+        aggregates = self._users.get(user_id)
+        if aggregates is None:
+            return await self.rebuild(user_id)
+        self._users.move_to_end(user_id)
+        return aggregates
+
+    def loaded(self, user_id: int) -> UserAggregates | None:
+        """Return a user's aggregates if they are in memory, without building them."""
+        return self._users.get(user_id)
+
+    async def rebuild(self, user_id: int) -> UserAggregates:
+        """Recompute a user's aggregates from all of their submitted records."""
+        aggregates = UserAggregates()
+        async for page in sleep_records.iter_history(user_id):
+            for record in page:
+                aggregates.apply(record.date, None, Totals.from_record(record))
+        self._users[user_id] = aggregates
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return aggregates
+
+    def forget(self, user_id: int):
+        """Drop a user's aggregates, eg after a bulk change, to rebuild on next use."""
+        self._users.pop(user_id, None)
+
+    def record_submitted(
+        self, user_id: int, previous: SleepRecord | None, record: SleepRecord | None
+    ):
+        """Count a newly submitted record, replacing `previous` if it was submitted."""
+        aggregates = self._users.get(user_id)
+        if aggregates is None:
+            # Not loaded, the record will be picked up when it is built
+            return
+        if record is None:
+            # The write didn't return the record, rebuild on next use instead
+            del self._users[user_id]
+            return
+        old = (
+            Totals.from_record(previous) if previous and previous.is_submitted else None
+        )
+        aggregates.apply(record.date, old, Totals.from_record(record))
+
+    async def summary(self, user_id: int, days: int, end: date) -> Summary | None:
+        aggregates = await self.get(user_id)
+        return aggregates.window(days, end).summary()
+
+
+aggregates = AggregateStore()
@@ -0,0 +1,96 @@
+"""Compare /chart rendering in the process pool against drawing on the event loop.
+
+Renders charts for several users against the in-memory Supabase stand-in while
+a heartbeat task measures how long the event loop stalls, then times asking for
+the same charts again from the cache. tests/test_charts.py checks the caching.
+
+    python benchmarks/chart_render.py --users 8 --days 90
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from benchmarks.db_offload import measure_loop_lag  # noqa: E402
+from benchmarks.fake_supabase import (  # noqa: E402
+    FakeSupabase,
+    install,
+    load_history,
+    make_history,
+)
+from charts import ChartRenderer, chart_data, render_chart_png  # noqa: E402
+from date_utils import TIMEZONE  # noqa: E402
+from repository import sleep_records  # noqa: E402
+
+
+async def timed(fn, *args) -> tuple[float, float]:
+    """Run fn, returning seconds taken and the worst event loop stall meanwhile."""
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    await fn(*args)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return elapsed, await lag_task
+
+
+async def run(args, tmp: str):
+    client = FakeSupabase()
+    install(client)
+    today = datetime.now(TIMEZONE).date()
+    for user_id in range(1, args.users + 1):
+        load_history(client, make_history(user_id, args.days, today))
+    users = range(1, args.users + 1)
+
+    async def inline():
+        for user_id in users:
+            records = await sleep_records.list_range(
+                user_id, today - timedelta(days=args.days - 1), today
+            )
+            path = os.path.join(tmp, f"inline-{user_id}.png")
+            render_chart_png(chart_data(records), args.days, path)
+
+    async def pooled():
+        await asyncio.gather(*(main.get_chart(user_id, args.days) for user_id in users))
+
+    elapsed, lag = await timed(inline)
+    print(f"{'on the loop':>20}: {elapsed:6.2f}s, max loop stall {lag * 1000:8.1f}ms")
+
+    main.charts = ChartRenderer(path=os.path.join(tmp, "charts"))
+    # Starting the workers and importing matplotlib is paid once, not per chart
+    workers = main.charts.workers
+    await asyncio.gather(
+        *(main.charts.render(chart_data([]), -i) for i in range(workers))
+    )
+    elapsed, lag = await timed(pooled)
+    print(f"{'process pool':>20}: {elapsed:6.2f}s, max loop stall {lag * 1000:8.1f}ms")
+
+    requests = client.requests
+    elapsed, lag = await timed(pooled)
+    print(
+        f"{'cached':>20}: {elapsed * 1000:6.2f}ms, "
+        f"{client.requests - requests} Supabase requests"
+    )
+    main.charts.shutdown()
+
+
+def main_():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--users", type=int, default=8)
+    arg_parser.add_argument("--days", type=int, default=90, choices=main.VIEW_WINDOWS)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(args, tmp))
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,92 @@
+"""Compare update throughput with blocking vs offloaded Supabase calls.
+
+Simulates a burst of updates that each make one Supabase request with a fixed
+latency, and reports throughput plus the worst event loop stall observed.
+
+    python benchmarks/db_offload.py --updates 200 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+class SlowQuery:
+    """Stand-in for a Supabase query builder whose execute() takes `latency` seconds."""
+
+    path = "/sleep_records"
+    http_method = "GET"
+    headers = {}
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def execute(self):
+        time.sleep(self.latency)
+        return []
+
+
+async def blocking_update(latency: float):
+    SlowQuery(latency).execute()
+    await asyncio.sleep(0)
+
+
+async def offloaded_update(latency: float):
+    await database.execute(SlowQuery(latency))
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval=0.005) -> float:
+    """Return the worst delay between when a heartbeat was due and when it ran."""
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        worst = max(worst, loop.time() - expected)
+    return worst
+
+
+async def run(handler, updates: int, latency: float) -> dict:
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(handler(latency) for _ in range(updates)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return {
+        "elapsed_s": elapsed,
+        "updates_per_s": updates / elapsed,
+        "max_loop_lag_ms": await lag_task * 1000,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--updates", type=int, default=200)
+    arg_parser.add_argument("--latency", type=float, default=0.05)
+    args = arg_parser.parse_args()
+
+    print(
+        f"{args.updates} updates, {args.latency * 1000:.0f}ms simulated DB latency, "
+        f"DB_MAX_CONCURRENCY={database.DB_MAX_CONCURRENCY}"
+    )
+    for name, handler in [
+        ("blocking", blocking_update),
+        ("offloaded", offloaded_update),
+    ]:
+        result = asyncio.run(run(handler, args.updates, args.latency))
+        print(
+            f"{name:>10}: {result['updates_per_s']:8.1f} updates/s, "
+            f"{result['elapsed_s']:6.2f}s total, "
+            f"max loop lag {result['max_loop_lag_ms']:8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""In-memory stand-in for the Google Sheets values API, for running offline.
+
+Implements get, update and append on spreadsheets().values() for a single sheet,
+with an optional fixed latency per request.
+"""
+
+import re
+import time
+
+
+class FakeRequest:
+    def __init__(self, values: "FakeValues", handler, kwargs: dict):
+        self.values = values
+        self.handler = handler
+        self.kwargs = kwargs
+
+    def execute(self) -> dict:
+        self.values.requests += 1
+        if self.values.latency:
+            time.sleep(self.values.latency)
+        if self.values.fail_next:
+            self.values.fail_next -= 1
+            raise ConnectionError("simulated Sheets API failure")
+        return self.handler(**self.kwargs)
+
+
+class FakeValues:
+    """Drop-in for spreadsheets().values() holding one sheet's cells as rows."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        # Number of upcoming requests that fail
+        self.fail_next = 0
+        # Row 1 holds the row counter the old integration kept in A1
+        self.rows: list[list] = [[1]]
+
+    @staticmethod
+    def _first_row(range: str) -> int | None:
+        match = re.search(r"![A-Z]+(\d+)", range)
+        return int(match.group(1)) if match else None
+
+    def get(self, spreadsheetId: str, range: str):
+        def handler():
+            row = self._first_row(range)
+            values = self.rows[row - 1 : row] if row <= len(self.rows) else []
+            return {"values": values}
+
+        return FakeRequest(self, handler, {})
+
+    def update(self, spreadsheetId: str, range: str, valueInputOption: str, body):
+        def handler():
+            row = self._first_row(range)
+            while len(self.rows) < row:
+                self.rows.append([])
+            self.rows[row - 1] = list(body["values"][0])
+            return {"updatedCells": len(body["values"][0])}
+
+        return FakeRequest(self, handler, {})
+
+    def append(
+        self, spreadsheetId: str, range: str, valueInputOption: str, body, **kwargs
+    ):
+        def handler():
+            # Appends after the last non-empty row, like the real API
+            while self.rows and not self.rows[-1]:
+                self.rows.pop()
+            self.rows.extend(list(row) for row in body["values"])
+            return {"updates": {"updatedRows": len(body["values"])}}
+
+        return FakeRequest(self, handler, {})
@@ -0,0 +1,274 @@
+"""In-memory stand-in for the Supabase client, for running benchmarks offline.
+
+Implements the subset of the query builder the bot uses, over plain dicts, with
+an optional fixed latency per request to simulate the network round trip.
+"""
+
+import random
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+
+PRIMARY_KEYS = {"sleep_records": ("user_id", "date"), "users": ("id",)}
+DEFAULTS = {
+    "sleep_records": {
+        "sleep_time": None,
+        "first_alarm_time": None,
+        "wakeup_time": None,
+        "energy_score": None,
+        "clarity_score": None,
+        "is_submitted": False,
+    },
+}
+
+
+@dataclass
+class FakeResponse:
+    data: list[dict]
+
+
+class FakeQuery:
+    def __init__(self, client: "FakeSupabase", table: str):
+        self.client = client
+        self.table = table
+        self.action = "select"
+        self.columns = "*"
+        self.payload = None
+        self.on_conflict = ""
+        self.ignore_duplicates = False
+        self.filters = []
+        self.order_by = None
+        self.row_limit = None
+        # Set by eq("user_id", ...), to look up only that user's sleep_records
+        self.user_id = None
+
+    # Request details the real query builders expose, read by database.execute
+    @property
+    def path(self) -> str:
+        return f"/{self.table}"
+
+    @property
+    def http_method(self) -> str:
+        return {"select": "GET", "update": "PATCH"}.get(self.action, "POST")
+
+    @property
+    def headers(self) -> dict:
+        if self.action == "upsert":
+            return {"prefer": "return=representation,resolution=merge-duplicates"}
+        return {}
+
+    def select(self, columns="*"):
+        self.action, self.columns = "select", columns
+        return self
+
+    def insert(self, json):
+        self.action, self.payload = "insert", json
+        return self
+
+    def upsert(self, json, *, on_conflict="", ignore_duplicates=False, **kwargs):
+        self.action, self.payload = "upsert", json
+        self.on_conflict, self.ignore_duplicates = on_conflict, ignore_duplicates
+        return self
+
+    def update(self, json):
+        self.action, self.payload = "update", json
+        return self
+
+    def _filter(self, op, column, value):
+        self.filters.append((op, column, value))
+        return self
+
+    def eq(self, column, value):
+        if column == "user_id":
+            self.user_id = value
+        return self._filter(lambda a, b: a == b, column, value)
+
+    def gt(self, column, value):
+        return self._filter(lambda a, b: a is not None and a > b, column, value)
+
+    def gte(self, column, value):
+        return self._filter(lambda a, b: a is not None and a >= b, column, value)
+
+    def lt(self, column, value):
+        return self._filter(lambda a, b: a is not None and a < b, column, value)
+
+    def lte(self, column, value):
+        return self._filter(lambda a, b: a is not None and a <= b, column, value)
+
+    def in_(self, column, values):
+        return self._filter(lambda a, b: a in b, column, set(values))
+
+    def or_(self, filters: str):
+        # Only the "column.not.is.null" terms the bot uses
+        columns = [term.split(".")[0] for term in filters.split(",")]
+        return self._filter(
+            lambda row, _: any(row.get(c) is not None for c in columns), None, None
+        )
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, size):
+        self.row_limit = size
+        return self
+
+    def execute(self) -> FakeResponse:
+        self.client.requests += 1
+        if self.client.latency:
+            time.sleep(self.client.latency)
+        return FakeResponse(getattr(self, f"_{self.action}")())
+
+    def _matches(self, row) -> bool:
+        return all(
+            op(row, value) if column is None else op(row.get(column), value)
+            for op, column, value in self.filters
+        )
+
+    def _candidates(self) -> list[dict]:
+        rows = self.client.tables.setdefault(self.table, {})
+        if self.table == "sleep_records" and self.user_id is not None:
+            rows = self.client.user_rows(self.user_id)
+        return [row for row in rows.values() if self._matches(row)]
+
+    def _select(self) -> list[dict]:
+        rows = self._candidates()
+        if self.order_by:
+            column, desc = self.order_by
+            rows.sort(key=lambda row: row[column], reverse=desc)
+        if self.row_limit is not None:
+            rows = rows[: self.row_limit]
+        if self.columns != "*":
+            columns = self.columns.split(",")
+            return [{c: row[c] for c in columns} for row in rows]
+        return [dict(row) for row in rows]
+
+    def _insert(self) -> list[dict]:
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        return [dict(self.client.put(self.table, row)) for row in rows]
+
+    def _upsert(self) -> list[dict]:
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        written = []
+        for row in rows:
+            existing = self.client.get(self.table, row)
+            if existing is not None and self.ignore_duplicates:
+                continue
+            written.append(dict(self.client.put(self.table, row, existing)))
+        return written
+
+    def _update(self) -> list[dict]:
+        rows = self._candidates()
+        for row in rows:
+            row.update(self.payload)
+        return [dict(row) for row in rows]
+
+
+class FakeRPC:
+    def __init__(self, client: "FakeSupabase", fn: str, params: dict):
+        self.client = client
+        self.fn = fn
+        self.params = params
+        self.path = f"/rpc/{fn}"
+        self.http_method = "POST"
+        self.headers = {}
+
+    def execute(self) -> FakeResponse:
+        self.client.requests += 1
+        if self.client.latency:
+            time.sleep(self.client.latency)
+        if self.fn != "record_wakeup":
+            raise NotImplementedError(self.fn)
+        # Same semantics as sql/record_wakeup.sql
+        p = self.params
+        key = {"user_id": p["p_user_id"], "date": p["p_date"]}
+        existing = self.client.get("sleep_records", key)
+        if existing is None:
+            row = {
+                **key,
+                "bed_time": p["p_bed_time"],
+                "wakeup_time": p["p_wakeup_time"],
+            }
+            return FakeResponse([dict(self.client.put("sleep_records", row))])
+        if existing["is_submitted"]:
+            return FakeResponse([])
+        existing["wakeup_time"] = p["p_wakeup_time"]
+        return FakeResponse([dict(existing)])
+
+
+class FakeSupabase:
+    """Drop-in for supabase.Client, holding every table in memory."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self.tables: dict[str, dict[tuple, dict]] = {}
+        # sleep_records indexed by user, most queries filter on one user
+        self._by_user: dict[int, dict[tuple, dict]] = {}
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, fn: str, params: dict | None = None) -> FakeRPC:
+        return FakeRPC(self, fn, params or {})
+
+    def _key(self, table: str, row: dict) -> tuple:
+        return tuple(row[column] for column in PRIMARY_KEYS[table])
+
+    def user_rows(self, user_id: int) -> dict[tuple, dict]:
+        return self._by_user.get(user_id, {})
+
+    def get(self, table: str, row: dict) -> dict | None:
+        return self.tables.get(table, {}).get(self._key(table, row))
+
+    def put(self, table: str, row: dict, existing: dict | None = None) -> dict:
+        if existing is None:
+            existing = dict(DEFAULTS.get(table, {}))
+            key = self._key(table, row)
+            self.tables.setdefault(table, {})[key] = existing
+            if table == "sleep_records":
+                self._by_user.setdefault(row["user_id"], {})[key] = existing
+        existing.update(row)
+        return existing
+
+
+def make_history(user_id: int, records: int, end: date | None = None) -> list[dict]:
+    """Synthetic submitted sleep_records rows for the `records` days up to end."""
+    rng = random.Random(user_id)
+    end = end or date.today()
+    rows = []
+    for offset in range(records):
+        day = end - timedelta(days=offset)
+        # Local (UTC+8) 10pm-1am bedtimes, as UTC like PostgREST returns them
+        bed_time = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+        bed_time -= timedelta(hours=10, minutes=-rng.randint(0, 180))
+        sleep_time = bed_time + timedelta(minutes=rng.randint(5, 60))
+        alarm_time = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+        alarm_time -= timedelta(hours=rng.choice([1, 2]))
+        wakeup_time = alarm_time + timedelta(minutes=rng.randint(0, 45))
+        rows.append(
+            {
+                "user_id": user_id,
+                "date": day.isoformat(),
+                "bed_time": bed_time.isoformat(),
+                "sleep_time": sleep_time.isoformat(),
+                "first_alarm_time": alarm_time.isoformat(),
+                "wakeup_time": wakeup_time.isoformat(),
+                "energy_score": rng.randint(1, 5),
+                "clarity_score": rng.randint(1, 5),
+                "is_submitted": True,
+            }
+        )
+    return rows
+
+
+def load_history(client: FakeSupabase, rows: list[dict]):
+    for row in rows:
+        client.put("sleep_records", row)
+
+
+def install(client: FakeSupabase):
+    """Have get_client() return the given client instead of connecting to Supabase."""
+    import database
+
+    database._client = client
@@ -0,0 +1,126 @@
+"""Offline stand-in for the Telegram Bot API, for running the bot in benchmarks.
+
+FakeBotRequest answers Bot API calls locally with an optional fixed latency, and
+the helpers build the updates Telegram would send for commands, replies and
+inline button presses.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+
+from telegram import Update
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "SleepTracker",
+    "username": "sleeptracker_bench_bot",
+    "can_join_groups": False,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+
+class FakeBotRequest(BaseRequest):
+    """BaseRequest answering every Bot API call locally after `latency` seconds."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = itertools.count(1000)
+
+    @property
+    def read_timeout(self) -> float | None:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: RequestData | None = None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ) -> tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return (
+            200,
+            json.dumps({"ok": True, "result": self._result(endpoint, params)}).encode(),
+        )
+
+    def _result(self, endpoint: str, params: dict):
+        if endpoint == "getMe":
+            return BOT_USER
+        if endpoint in ("sendMessage", "editMessageText"):
+            return {
+                "message_id": params.get("message_id") or next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": params.get("chat_id"), "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        return True
+
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+
+def _message(user_id: int, text: str, message_id: int) -> dict:
+    message = {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        command = text.split()[0]
+        message["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": len(command)}
+        ]
+    return message
+
+
+def message_update(bot, user_id: int, text: str) -> Update:
+    """An update for a private message (or command) sent by the user."""
+    update_id = next(_update_ids)
+    return Update.de_json(
+        {"update_id": update_id, "message": _message(user_id, text, update_id)}, bot
+    )
+
+
+def callback_update(bot, user_id: int, data: str, message_id: int = 1) -> Update:
+    """An update for the user pressing an inline button with callback `data`."""
+    update_id = next(_update_ids)
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": _user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {**_message(user_id, "", message_id), "from": BOT_USER},
+            },
+        },
+        bot,
+    )
@@ -0,0 +1,283 @@
+"""Load test the bot's conversation flow with many simultaneous users, offline.
+
+Builds the same Application as main() with a fake Telegram API and the in-memory
+Supabase stand-in, then has every user log a night at the same time: /sleep,
+/wakey, an energy edit and submitting the form. Reports throughput and the
+latency of each update from when it is queued until its handlers finish.
+--metrics writes the Prometheus metrics collected during the run, and --profile
+profiles a fraction of the updates to compare its overhead.
+
+    python benchmarks/load_test.py --users 500 --db-latency 0.03 --api-latency 0.05
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update  # noqa: E402
+from telegram.ext import ApplicationBuilder, TypeHandler  # noqa: E402
+
+import main  # noqa: E402
+from benchmarks.fake_supabase import FakeSupabase, install  # noqa: E402
+from benchmarks.fake_telegram import (  # noqa: E402
+    FakeBotRequest,
+    callback_update,
+    message_update,
+)
+from date_utils import TIMEZONE  # noqa: E402
+from dedup import deduplicator  # noqa: E402
+from metrics import render_metrics  # noqa: E402
+from persistence import SQLitePersistence  # noqa: E402
+from profiling import profiler  # noqa: E402
+from update_processor import UPDATE_CONCURRENCY, PerUserUpdateProcessor  # noqa: E402
+
+# (kind, payload) steps each user goes through, one update each
+FLOW = [
+    ("message", "/sleep"),
+    ("message", "/wakey"),
+    ("callback", "edit_energy"),
+    ("message", "4"),
+    ("callback", "submit_form"),
+]
+
+
+class MorningClock(datetime):
+    """datetime whose now() runs from a fixed local time, so the flow is allowed."""
+
+    start = None
+    offset = None
+
+    @classmethod
+    def now(cls, tz=None):
+        current = cls.start + timedelta(seconds=time.monotonic() - cls.offset)
+        return current.astimezone(tz) if tz else current.replace(tzinfo=None)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+class LoadTest:
+    def __init__(self, app, bot_request: FakeBotRequest, redeliver: float = 0.0):
+        self.app = app
+        self.bot_request = bot_request
+        # Fraction of updates delivered twice, as Telegram does for slow webhooks
+        self.redeliver = redeliver
+        self.redelivered = 0
+        self._rng = random.Random(1)
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors = 0
+        self._pending: dict[int, tuple[float, asyncio.Future]] = {}
+        app.add_handler(TypeHandler(Update, self._processed), group=1)
+        app.add_error_handler(self._error)
+
+    async def _processed(self, update: Update, context):
+        queued_at, done = self._pending.pop(update.update_id)
+        done.set_result(time.perf_counter() - queued_at)
+
+    async def _error(self, update, context):
+        self.errors += 1
+        logging.getLogger(__name__).warning("Handler failed", exc_info=context.error)
+
+    async def send(self, update: Update) -> float:
+        done = asyncio.get_running_loop().create_future()
+        self._pending[update.update_id] = (time.perf_counter(), done)
+        await self.app.update_queue.put(update)
+        if self.redeliver and self._rng.random() < self.redeliver:
+            self.redelivered += 1
+            await self.app.update_queue.put(update)
+        return await done
+
+    async def run_user(self, user_id: int, delay: float, interleave: bool = False):
+        await asyncio.sleep(delay)
+        sent = []
+        for kind, payload in FLOW:
+            if kind == "message":
+                update = message_update(self.app.bot, user_id, payload)
+            else:
+                update = callback_update(self.app.bot, user_id, payload)
+            if interleave:
+                # Sent straight after one another, as a user tapping quickly would
+                sent.append((payload, asyncio.create_task(self.send(update))))
+                await asyncio.sleep(0)
+            else:
+                self.latencies[payload].append(await self.send(update))
+        for payload, task in sent:
+            self.latencies[payload].append(await task)
+
+
+async def check_flow(
+    persistence: SQLitePersistence, client: FakeSupabase, users: int
+) -> list[str]:
+    """Return what's wrong with each user's record and conversation after the flow."""
+    problems = []
+    records = {row["user_id"]: row for row in client.tables["sleep_records"].values()}
+    conversations = await persistence.get_conversations("sleep_tracker")
+    for user_id in range(1, users + 1):
+        record = records.get(user_id)
+        if not record or not record["is_submitted"] or record["energy_score"] != 4:
+            problems.append(f"user {user_id}: record {record}")
+        state = conversations.get((user_id, user_id))
+        if state is not None:
+            problems.append(f"user {user_id}: conversation left in state {state}")
+    return problems
+
+
+async def run(args) -> dict:
+    client = FakeSupabase(latency=args.db_latency)
+    install(client)
+    bot_request = FakeBotRequest(latency=args.api_latency)
+    with tempfile.TemporaryDirectory() as tmp:
+        builder = (
+            ApplicationBuilder()
+            .token("123456:bench")
+            .request(bot_request)
+            .get_updates_request(FakeBotRequest())
+            .updater(None)
+            .persistence(
+                SQLitePersistence(
+                    os.path.join(tmp, "bench.sqlite"),
+                    update_interval=main.PERSISTENCE_INTERVAL,
+                )
+            )
+        )
+        if args.unordered:
+            builder = builder.concurrent_updates(args.concurrent_updates)
+        else:
+            builder = builder.concurrent_updates(
+                PerUserUpdateProcessor(args.concurrent_updates)
+            )
+        app = main.build_application(builder)
+        load_test = LoadTest(app, bot_request, args.redeliver)
+
+        async with app:
+            await app.start()
+            start = time.perf_counter()
+            rng = random.Random(0)
+            await asyncio.gather(
+                *(
+                    load_test.run_user(
+                        user_id, rng.uniform(0, args.ramp), args.interleave
+                    )
+                    for user_id in range(1, args.users + 1)
+                )
+            )
+            elapsed = time.perf_counter() - start
+            await app.stop()
+        # Read back what was saved on shutdown
+        saved = SQLitePersistence(os.path.join(tmp, "bench.sqlite"))
+        problems = await check_flow(saved, client, args.users)
+
+    latencies = [v for values in load_test.latencies.values() for v in values]
+    return {
+        "elapsed": elapsed,
+        "latencies": latencies,
+        "by_step": load_test.latencies,
+        "errors": load_test.errors,
+        "db_requests": client.requests,
+        "api_calls": bot_request.calls,
+        "rate_limiter": app.bot.rate_limiter.stats(),
+        "problems": problems,
+        "redelivered": load_test.redelivered,
+    }
+
+
+def main_():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--users", type=int, default=200)
+    arg_parser.add_argument("--db-latency", type=float, default=0.03)
+    arg_parser.add_argument("--api-latency", type=float, default=0.05)
+    arg_parser.add_argument(
+        "--ramp", type=float, default=0.0, help="seconds over which users start"
+    )
+    arg_parser.add_argument(
+        "--concurrent-updates",
+        type=int,
+        default=UPDATE_CONCURRENCY,
+        help="process this many updates at once, 1 to process them one by one",
+    )
+    arg_parser.add_argument(
+        "--unordered",
+        action="store_true",
+        help="don't keep each user's updates in order, to compare",
+    )
+    arg_parser.add_argument(
+        "--interleave",
+        action="store_true",
+        help="send each user's updates without waiting for the previous one",
+    )
+    arg_parser.add_argument(
+        "--redeliver",
+        type=float,
+        default=0.0,
+        help="fraction of updates sent twice, which should all be dropped",
+    )
+    arg_parser.add_argument(
+        "--clock", default="07:30", help="local time the flow runs at (HH:MM)"
+    )
+    arg_parser.add_argument(
+        "--metrics", help="write what /metrics would serve after the run to this file"
+    )
+    arg_parser.add_argument(
+        "--profile",
+        type=float,
+        default=0.0,
+        help="fraction of updates to profile, reports go to PROFILE_DIR",
+    )
+    args = arg_parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    hour, minute = map(int, args.clock.split(":"))
+    MorningClock.start = datetime.now(TIMEZONE).replace(hour=hour, minute=minute)
+    MorningClock.offset = time.monotonic()
+    main.datetime = MorningClock
+    profiler.sample_rate = args.profile
+
+    result = asyncio.run(run(args))
+    latencies = result["latencies"]
+    print(
+        f"{args.users} users, {len(latencies)} updates, "
+        f"{args.db_latency * 1000:.0f}ms DB / {args.api_latency * 1000:.0f}ms API latency, "
+        f"concurrent_updates={args.concurrent_updates}"
+        f"{' unordered' if args.unordered else ' per user'}"
+        f"{', interleaved' if args.interleave else ''}"
+    )
+    print(f"{'throughput':>16}: {len(latencies) / result['elapsed']:10.1f} updates/s")
+    for pct in (50, 95, 99):
+        print(f"{f'p{pct} latency':>16}: {percentile(latencies, pct) * 1000:10.1f}ms")
+    print("\np95 latency per step:")
+    for step, values in result["by_step"].items():
+        print(f"{step:>16}: {percentile(values, 95) * 1000:10.1f}ms")
+    print(f"\n{'errors':>16}: {result['errors']:10d}")
+    print(f"{'wrong results':>16}: {len(result['problems']):10d}")
+    if args.redeliver:
+        print(f"{'redelivered':>16}: {result['redelivered']:10d}")
+        print(f"{'dropped':>16}: {deduplicator.suppressed:10d}")
+    for problem in result["problems"][:5]:
+        print(f"{'':>18}{problem}")
+    print(f"{'db requests':>16}: {result['db_requests']:10d}")
+    print(f"{'api calls':>16}: {sum(result['api_calls'].values()):10d}")
+    limiter = result["rate_limiter"]
+    print(f"{'throttled calls':>16}: {limiter['delayed']:10d}")
+    print(f"{'avg api wait':>16}: {limiter['avg_wait'] * 1000:10.1f}ms")
+    print(f"{'max api wait':>16}: {limiter['max_wait'] * 1000:10.1f}ms")
+    if args.profile:
+        print(f"{'profiled calls':>16}: {profiler.stats()['profiled']:10d}")
+        profiler.flush()
+    if args.metrics:
+        with open(args.metrics, "w") as f:
+            f.write(render_metrics())
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,75 @@
+"""Compare timestamp decoding against the previous dateutil based parser.
+
+Decodes a synthetic column of Supabase timestamps with each implementation and
+reports the best time per run.
+
+    python benchmarks/parse_datetime.py --rows 10000
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dateutil import parser  # noqa: E402
+
+from date_utils import TIMEZONE  # noqa: E402
+from parsers import parse_datetime_string, parse_datetime_strings  # noqa: E402
+from stats import _epoch_seconds  # noqa: E402
+
+
+def dateutil_parse_datetime_string(dt_str: str) -> datetime:
+    """The implementation parse_datetime_string replaced."""
+    return parser.isoparse(dt_str).astimezone(TIMEZONE)
+
+
+def sample_timestamps(rows: int) -> list[str]:
+    """Timestamps shaped like PostgREST output, with trimmed fractional seconds."""
+    random.seed(0)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    values = []
+    for _ in range(rows):
+        dt = start + timedelta(
+            seconds=random.randint(0, 10 * 365 * 86400),
+            microseconds=random.choice([0, 0, 500000, 123456, 120000]),
+        )
+        value = dt.isoformat()
+        if dt.microsecond:
+            fraction, offset = value.split(".")[1].split("+")
+            value = f"{value.split('.')[0]}.{fraction.rstrip('0')}+{offset}"
+        values.append(value)
+    return values
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--rows", type=int, default=10000)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    values = sample_timestamps(args.rows)
+    for value in values[:100]:
+        assert parse_datetime_string(value) == dateutil_parse_datetime_string(value)
+
+    cases = {
+        "dateutil (previous)": lambda: [
+            dateutil_parse_datetime_string(v) for v in values
+        ],
+        "parse_datetime_string": lambda: [parse_datetime_string(v) for v in values],
+        "parse_datetime_strings": lambda: parse_datetime_strings(values),
+        "stats epoch column": lambda: _epoch_seconds(values),
+    }
+    print(f"{args.rows} timestamps, best of {args.repeat}")
+    baseline = None
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        baseline = baseline or best
+        print(f"{name:>24}: {best * 1000:8.2f}ms ({baseline / best:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Compare the buffered Sheets mirror against the old per-row Google Sheets writes.
+
+Mirrors synthetic sleep records into an in-memory stand-in for the Sheets values
+API with simulated latency, and reports requests and time for each approach.
+tests/test_sheets.py checks the mirrored rows themselves.
+
+    python benchmarks/sheets_mirror.py --records 200 --latency 0.1
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_sheets import FakeValues  # noqa: E402
+from benchmarks.fake_supabase import make_history  # noqa: E402
+from models import SleepRecord  # noqa: E402
+from sheets import SHEET_NAME, SheetsMirror, sheet_row  # noqa: E402
+
+
+class LegacySheets:
+    """The write path of archive/gsheets.Sheets, which keeps a row counter in A1."""
+
+    def __init__(self, values: FakeValues):
+        self.sheets = values
+        self.cur_row = int(
+            self.sheets.get(spreadsheetId="bench", range=f"{SHEET_NAME}!A1:A1")
+            .execute()
+            .get("values")[0][0]
+        )
+
+    def append_row(self, row):
+        self.cur_row += 1
+        self.sheets.update(
+            spreadsheetId="bench",
+            range=f"{SHEET_NAME}!A1:A1",
+            valueInputOption="RAW",
+            body={"values": [[self.cur_row]]},
+        ).execute()
+        self.sheets.append(
+            spreadsheetId="bench",
+            range=f"{SHEET_NAME}!A{self.cur_row}:D{self.cur_row}",
+            valueInputOption="RAW",
+            body={"values": [row]},
+        ).execute()
+
+
+def run_legacy(records: list[SleepRecord], latency: float) -> tuple[float, int]:
+    values = FakeValues(latency)
+    start = time.perf_counter()
+    sheets = LegacySheets(values)
+    for record in records:
+        sheets.append_row(sheet_row(record))
+    return time.perf_counter() - start, values.requests
+
+
+async def run_mirror(
+    records: list[SleepRecord], latency: float, per_flush: int
+) -> tuple[float, int, FakeValues]:
+    values = FakeValues(latency)
+    mirror = SheetsMirror("bench", values=values)
+    start = time.perf_counter()
+    for i in range(0, len(records), per_flush):
+        mirror.add(records[i : i + per_flush])
+        await mirror.flush()
+    return time.perf_counter() - start, values.requests, values
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--records", type=int, default=200)
+    arg_parser.add_argument("--latency", type=float, default=0.1)
+    arg_parser.add_argument(
+        "--per-flush", type=int, default=50, help="records buffered between flushes"
+    )
+    args = arg_parser.parse_args()
+
+    records = [
+        SleepRecord.from_row(row)
+        for row in reversed(make_history(1, args.records, date.today()))
+    ]
+    print(
+        f"{args.records} records, {args.latency * 1000:.0f}ms simulated Sheets latency"
+    )
+    elapsed, requests = run_legacy(records, args.latency)
+    print(f"{'per-row (previous)':>20}: {requests:5d} requests {elapsed:8.2f}s")
+    elapsed, requests, _ = asyncio.run(
+        run_mirror(records, args.latency, args.per_flush)
+    )
+    print(f"{'buffered mirror':>20}: {requests:5d} requests {elapsed:8.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Measure cold start time, from launching Python until the first update is handled.
+
+Starts a fresh interpreter per run, like a new instance would, which imports
+main, builds the application against a fake Telegram API and the in-memory
+Supabase stand-in, and handles a /start. Reports the median time to reach each
+step. --eager-client also creates a real Supabase client right after the import,
+as importing database used to.
+
+    python benchmarks/startup.py --runs 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STEPS = ("interpreter", "import main", "build app", "start app", "first update")
+
+
+async def first_update(main, marks: dict, eager_client: bool):
+    import database
+    from benchmarks.fake_supabase import FakeSupabase, install
+    from benchmarks.fake_telegram import FakeBotRequest, message_update
+
+    if eager_client:
+        database.SUPABASE_URL = "http://localhost:54321"
+        database.SUPABASE_KEY = "bench.bench.bench"
+        database.get_client()
+        marks["import main"] = time.time()
+    install(FakeSupabase())
+
+    from telegram.ext import ApplicationBuilder
+
+    from persistence import SQLitePersistence
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = main.build_application(
+            ApplicationBuilder()
+            .token("123456:bench")
+            .request(FakeBotRequest())
+            .get_updates_request(FakeBotRequest())
+            .updater(None)
+            .persistence(SQLitePersistence(os.path.join(tmp, "bench.sqlite")))
+        )
+        marks["build app"] = time.time()
+        async with app:
+            await app.start()
+            marks["start app"] = time.time()
+            await app.process_update(message_update(app.bot, 1, "/start"))
+            marks["first update"] = time.time()
+            await app.stop()
+
+
+def child(eager_client: bool):
+    marks = {"interpreter": time.time()}
+    import main
+
+    marks["import main"] = time.time()
+    asyncio.run(first_update(main, marks, eager_client))
+    print(json.dumps(marks))
+
+
+def run_once(eager_client: bool) -> dict[str, float]:
+    """Return seconds from launching the interpreter until each step."""
+    command = [sys.executable, os.path.abspath(__file__), "--child"]
+    if eager_client:
+        command.append("--eager-client")
+    # Without the Supabase settings, as the bot must not need them to start
+    env = {k: v for k, v in os.environ.items() if not k.startswith("SUPABASE_")}
+    start = time.time()
+    output = subprocess.run(
+        command, cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    marks = json.loads(output.strip().splitlines()[-1])
+    return {step: marks[step] - start for step in STEPS}
+
+
+def main_():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--runs", type=int, default=5)
+    arg_parser.add_argument(
+        "--eager-client",
+        action="store_true",
+        help="create the Supabase client at import, as before",
+    )
+    arg_parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, ROOT)
+        child(args.eager_client)
+        return
+
+    runs = [run_once(args.eager_client) for _ in range(args.runs)]
+    print(
+        f"{args.runs} cold starts, Supabase client "
+        f"{'created at import' if args.eager_client else 'created on first use'}"
+    )
+    previous = 0.0
+    for step in STEPS:
+        elapsed = statistics.median(run[step] for run in runs)
+        print(
+            f"{step:>14}: {elapsed * 1000:8.1f}ms (+{(elapsed - previous) * 1000:.1f}ms)"
+        )
+        previous = elapsed
+
+
+if __name__ == "__main__":
+    main_()
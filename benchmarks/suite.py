@@ -0,0 +1,253 @@
+"""Benchmark parsing, date formatting and report rendering offline.
+
+Runs against an in-memory stand-in for Supabase with synthetic histories, and
+writes the results to JSON so runs can be compared. /trends statistics are
+timed beside a plain Python loop, which tests/test_stats.py checks them against.
+
+    python benchmarks/suite.py --output before.json
+    python benchmarks/suite.py --output after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import timeit
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from aggregates import aggregates  # noqa: E402
+from benchmarks.fake_supabase import (  # noqa: E402
+    FakeSupabase,
+    install,
+    load_history,
+    make_history,
+)
+from date_utils import (  # noqa: E402
+    TIMEZONE,
+    get_readable_date,
+    get_readable_duration,
+    get_readable_time,
+)
+from models import SleepForm  # noqa: E402
+from parsers import (  # noqa: E402
+    parse_24_hour_time_format,
+    parse_datetime_string,
+    parse_duration,
+)
+from reports import render_sleep_form, view_reports  # noqa: E402
+from repository import sleep_records  # noqa: E402
+from stats import SleepColumns, compute_trends  # noqa: E402
+
+HISTORY_SIZES = (7, 365, 3650)
+
+
+def run_case(name: str, fn, number: int, repeat: int, **params) -> dict:
+    best = min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+    result = {"name": name, **params, "per_call_us": round(best * 1e6, 3)}
+    label = " ".join([name, *(f"{k}={v}" for k, v in params.items())])
+    print(f"{label:>48}: {result['per_call_us']:12.2f}us")
+    return result
+
+
+def micro_benchmarks(repeat: int) -> list[dict]:
+    now = datetime.now(TIMEZONE)
+    timestamp = "2025-05-01T14:30:12.123456+00:00"
+    form = SleepForm(
+        sleep_date=now.date(),
+        bedtime=now - timedelta(hours=9),
+        fall_asleep=timedelta(minutes=15),
+        alarm=now - timedelta(minutes=20),
+        wakeup=now,
+    )
+    cases = [
+        ("parse_duration", lambda: parse_duration("1h30m")),
+        ("parse_24_hour_time_format", lambda: parse_24_hour_time_format("2230")),
+        ("parse_datetime_string", lambda: parse_datetime_string(timestamp)),
+        ("get_readable_date", lambda: get_readable_date(now)),
+        ("get_readable_time", lambda: get_readable_time(now)),
+        (
+            "get_readable_duration",
+            lambda: get_readable_duration(timedelta(hours=7, minutes=5)),
+        ),
+        ("render_sleep_form", lambda: render_sleep_form(form)),
+    ]
+    return [run_case(name, fn, 2000, repeat) for name, fn in cases]
+
+
+def view_benchmarks(repeat: int) -> list[dict]:
+    loop = asyncio.new_event_loop()
+    results = []
+    for user_id, records in enumerate(HISTORY_SIZES, start=1):
+        client = FakeSupabase()
+        install(client)
+        load_history(
+            client, make_history(user_id, records, datetime.now(TIMEZONE).date())
+        )
+
+        def cold_view(days):
+            # Aggregates are rebuilt from the whole history, as after a restart
+            aggregates._users.clear()
+            view_reports.clear()
+            return loop.run_until_complete(main.get_view_report(user_id, days))
+
+        def warm_view(days):
+            # Rendered again from the aggregates, as after a write
+            view_reports.clear()
+            return loop.run_until_complete(main.get_view_report(user_id, days))
+
+        def cached_view(days):
+            return loop.run_until_complete(main.get_view_report(user_id, days))
+
+        for days in main.VIEW_WINDOWS:
+            if days > records:
+                continue
+            number = 5 if records > 365 else 50
+            results.append(
+                run_case(
+                    "view_report_cold",
+                    lambda: cold_view(days),
+                    number,
+                    repeat,
+                    records=records,
+                    days=days,
+                )
+            )
+            results.append(
+                run_case(
+                    "view_report_warm",
+                    lambda: warm_view(days),
+                    200,
+                    repeat,
+                    records=records,
+                    days=days,
+                )
+            )
+            results.append(
+                run_case(
+                    "view_report_cached",
+                    lambda: cached_view(days),
+                    200,
+                    repeat,
+                    records=records,
+                    days=days,
+                )
+            )
+    loop.close()
+    return results
+
+
+def python_trends(rows: list[dict], today, target_hours: float) -> dict:
+    """Straightforward loop over the rows, timed beside compute_trends.
+
+    tests/test_stats.py checks compute_trends against it.
+    """
+    nights = {}
+    for row in rows:
+        sleep = parse_datetime_string(row["sleep_time"])
+        wakeup = parse_datetime_string(row["wakeup_time"])
+        nights[date.fromisoformat(row["date"])] = (wakeup - sleep).total_seconds()
+
+    def window(days, end):
+        values = [v for d, v in nights.items() if 0 <= (end - d).days < days]
+        return sum(values) / len(values) if values else None
+
+    return {
+        "mean_short": window(7, today),
+        "mean_long": window(28, today),
+        "mean_long_before": window(28, today - timedelta(days=28)),
+        "debt_long": sum(
+            target_hours * 3600 - v for d, v in nights.items() if (today - d).days < 28
+        ),
+        "debt_total": sum(target_hours * 3600 - v for v in nights.values()),
+    }
+
+
+def trends_benchmarks(repeat: int) -> list[dict]:
+    today = datetime.now(TIMEZONE).date()
+    results = []
+    for records in HISTORY_SIZES:
+        rows = make_history(1, records, today)
+        columns = SleepColumns.from_rows(rows)
+
+        number = 20 if records > 365 else 200
+        results.append(
+            run_case(
+                "trends_compute",
+                lambda: compute_trends(columns, today, 8),
+                number,
+                repeat,
+                records=records,
+            )
+        )
+        results.append(
+            run_case(
+                "trends_report",
+                lambda: main.build_trends_report(rows, today, 8),
+                number,
+                repeat,
+                records=records,
+            )
+        )
+        results.append(
+            run_case(
+                "trends_python",
+                lambda: python_trends(rows, today, 8),
+                5 if records > 365 else 50,
+                repeat,
+                records=records,
+            )
+        )
+    return results
+
+
+def compare(results: list[dict], baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+
+    def key(result):
+        return tuple((k, v) for k, v in result.items() if k != "per_call_us")
+
+    before = {key(result): result["per_call_us"] for result in baseline}
+    print(f"\nCompared to {baseline_path} (>1 is faster now):")
+    for result in results:
+        if key(result) in before:
+            speedup = before[key(result)] / result["per_call_us"]
+            label = " ".join(f"{v}" for k, v in key(result))
+            print(f"{label:>48}: {speedup:8.2f}x")
+
+
+def main_():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--output", default="bench_results.json")
+    arg_parser.add_argument("--compare", help="results JSON of an earlier run")
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    results = (
+        micro_benchmarks(args.repeat)
+        + view_benchmarks(args.repeat)
+        + trends_benchmarks(args.repeat)
+    )
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "timestamp": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"\nWrote {len(results)} results to {args.output}")
+    print(f"Record cache: {sleep_records.stats()}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main_()
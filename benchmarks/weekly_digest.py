@@ -0,0 +1,184 @@
+"""Run the weekly digest for many users offline and resume it after a crash.
+
+Sends every user in the in-memory Supabase stand-in their digest through the
+bot's rate limiter and a fake Telegram API, counting the Supabase requests it
+takes. The run is abandoned partway through as a crash would leave it, and the bot
+rebuilt from the saved persistence resumes it, reporting how many users got their
+digest twice. tests/test_weekly_digest.py checks the same scenario.
+
+    python benchmarks/weekly_digest.py --users 2000 --db-latency 0.03
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.ext import ApplicationBuilder  # noqa: E402
+
+import main  # noqa: E402
+from benchmarks.fake_supabase import (  # noqa: E402
+    FakeSupabase,
+    install,
+    load_history,
+    make_history,
+)
+from benchmarks.fake_telegram import FakeBotRequest  # noqa: E402
+from date_utils import TIMEZONE  # noqa: E402
+from digest import DIGEST_STATE_KEY, WeeklyDigest  # noqa: E402
+from persistence import SQLitePersistence  # noqa: E402
+
+
+class RecordingBotRequest(FakeBotRequest):
+    """FakeBotRequest that also counts the messages sent to each chat."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency)
+        self.messages = Counter()
+
+    def _result(self, endpoint: str, params: dict):
+        if endpoint == "sendMessage":
+            self.messages[params["chat_id"]] += 1
+        return super()._result(endpoint, params)
+
+
+def build(path: str, bot_request: FakeBotRequest, rate: float):
+    app = main.build_application(
+        ApplicationBuilder()
+        .token("123456:bench")
+        .request(bot_request)
+        .get_updates_request(FakeBotRequest())
+        .updater(None)
+        .persistence(SQLitePersistence(path))
+    )
+    app.bot.rate_limiter.global_rate = rate
+    return app
+
+
+def context(app) -> SimpleNamespace:
+    """The parts of a job's CallbackContext the digest uses."""
+    return SimpleNamespace(bot=app.bot, bot_data=app.bot_data, application=app)
+
+
+async def interrupted_run(
+    tmp: str,
+    users: int,
+    batch_size: int = 200,
+    group_size: int = 20,
+    stop_at: float = 0.5,
+    rate: float = 1000,
+    db_latency: float = 0.0,
+    api_latency: float = 0.0,
+) -> dict:
+    """Run the digest, kill it partway through and resume it from what was saved.
+
+    The first run is abandoned as a crash would leave it, without stopping the
+    application, so only what the digest saved itself is there to resume from.
+    """
+    client = FakeSupabase(latency=db_latency)
+    install(client)
+    today = datetime.now(TIMEZONE).date()
+    for user_id in range(1, users + 1):
+        client.put("users", {"id": user_id, "username": f"user{user_id}"})
+        # Every tenth user logged nothing this week
+        if user_id % 10:
+            load_history(client, make_history(user_id, 14, today))
+
+    path = os.path.join(tmp, "digest.sqlite")
+    bot_request = RecordingBotRequest(latency=api_latency)
+
+    app = build(path, bot_request, rate)
+    await app.initialize()
+    start = time.perf_counter()
+    task = asyncio.create_task(WeeklyDigest(batch_size, group_size).run(context(app)))
+    while len(bot_request.messages) < users * stop_at and not task.done():
+        await asyncio.sleep(0.001)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    first_run = time.perf_counter() - start
+    sent_before = len(bot_request.messages)
+
+    app = build(path, bot_request, rate)
+    async with app:
+        saved = dict(app.bot_data[DIGEST_STATE_KEY])
+        start = time.perf_counter()
+        await WeeklyDigest(batch_size, group_size).resume(context(app))
+        resumed = time.perf_counter() - start
+        done = app.bot_data[DIGEST_STATE_KEY]["done"]
+
+    return {
+        "first_run": first_run,
+        "sent_before": sent_before,
+        "saved": saved,
+        "resumed": resumed,
+        "done": done,
+        "messages": bot_request.messages,
+        "db_requests": client.requests,
+    }
+
+
+async def run(args, tmp: str):
+    result = await interrupted_run(
+        tmp,
+        args.users,
+        args.batch_size,
+        args.group_size,
+        args.stop_at,
+        args.rate,
+        args.db_latency,
+        args.api_latency,
+    )
+    messages = result["messages"]
+    repeated = [user_id for user_id, count in messages.items() if count > 1]
+    missing = args.users - len(messages)
+    print(
+        f"stopped after {result['sent_before']} of {args.users} users in "
+        f"{result['first_run']:.2f}s, saved progress: up to user "
+        f"{result['saved']['last_user_id']}"
+    )
+    print(f"resumed and finished in {result['resumed']:.2f}s")
+    print(
+        f"{result['db_requests']} Supabase requests for {args.users} users "
+        f"({args.batch_size} per batch), {sum(messages.values())} messages, "
+        f"{len(repeated)} sent twice, {missing} missed"
+    )
+
+
+def main_():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--users", type=int, default=2000)
+    arg_parser.add_argument("--batch-size", type=int, default=200)
+    arg_parser.add_argument(
+        "--group-size", type=int, default=20, help="digests sent between saves"
+    )
+    arg_parser.add_argument("--db-latency", type=float, default=0.03)
+    arg_parser.add_argument("--api-latency", type=float, default=0.05)
+    arg_parser.add_argument(
+        "--rate",
+        type=float,
+        default=1000,
+        help="messages per second Telegram allows, 30 in production",
+    )
+    arg_parser.add_argument(
+        "--stop-at",
+        type=float,
+        default=0.5,
+        help="fraction of users sent to before the first run is stopped",
+    )
+    args = arg_parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(args, tmp))
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime
+
+from models import SleepRecord
+from stats import SLEEP_TARGET_HOURS
+
+logger = logging.getLogger(__name__)
+
+# Directory rendered charts are kept in, and the most files kept there
+CHART_CACHE_DIR = os.environ.get("CHART_CACHE_DIR", "charts")
+CHART_CACHE_MAX_FILES = int(os.environ.get("CHART_CACHE_MAX_FILES", "2000"))
+# Processes rendering charts, matplotlib holds the GIL while it draws
+CHART_WORKERS = int(os.environ.get("CHART_WORKERS", "2"))
+
+
+def _hours(dt, base) -> float:
+    """Hours from midnight at the start of `base`, negative for the evening before."""
+    return (dt.replace(tzinfo=None) - base).total_seconds() / 3600
+
+
+def chart_data(records: list[SleepRecord]) -> dict:
+    """Reduce records to the plain lists the chart is drawn from, oldest first.
+
+    These are sent to a worker process, so they are kept small and picklable.
+    """
+    records = sorted((r for r in records if r.is_submitted), key=lambda r: r.date)
+    data = {"dates": [], "bedtime": [], "wakeup": [], "duration": []}
+    for record in records:
+        midnight = datetime.combine(record.date, datetime.min.time())
+        data["dates"].append(record.date.isoformat())
+        data["bedtime"].append(_hours(record.bed_time, midnight))
+        data["wakeup"].append(_hours(record.wakeup_time, midnight))
+        data["duration"].append(record.duration.total_seconds() / 3600)
+    return data
+
+
+def data_digest(data: dict, days: int) -> str:
+    """Name a chart after what it shows, so files stay valid across restarts."""
+    return hashlib.sha256(repr((days, data)).encode()).hexdigest()[:32]
+
+
+def render_chart_png(data: dict, days: int, path: str) -> str:
+    """Draw bedtimes, wake-up times and durations to a PNG at `path`.
+
+    Runs in a worker process. The file is written under a temporary name first so
+    a half written chart is never served.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.dates as mdates
+    import matplotlib.pyplot as plt
+
+    dates = [date.fromisoformat(d) for d in data["dates"]]
+    fig, (times, durations) = plt.subplots(
+        2, 1, figsize=(8, 6), sharex=True, height_ratios=(3, 2)
+    )
+    try:
+        times.fill_between(
+            dates, data["bedtime"], data["wakeup"], color="#9db4e0", alpha=0.5
+        )
+        times.plot(dates, data["bedtime"], "o-", color="#3b5ba5", label="Bedtime")
+        times.plot(dates, data["wakeup"], "o-", color="#e0a030", label="Wake-up")
+        ticks = range(-6, 15, 2)
+        times.set_yticks(ticks, [f"{hour % 24:02d}:00" for hour in ticks])
+        # Later times lower down, like a calendar
+        times.set_ylim(max(14, max(data["wakeup"], default=0) + 1), -6)
+        times.legend(loc="lower left")
+        times.set_title(f"Your sleep over the past {days} days")
+        times.grid(alpha=0.3)
+
+        durations.bar(dates, data["duration"], color="#6a8fd0")
+        durations.axhline(SLEEP_TARGET_HOURS, color="grey", linestyle="--", linewidth=1)
+        durations.set_ylabel("Hours asleep")
+        durations.grid(alpha=0.3)
+        durations.xaxis.set_major_formatter(mdates.DateFormatter("%-d %b"))
+        fig.autofmt_xdate()
+        fig.tight_layout()
+
+        partial = f"{path}.{os.getpid()}.tmp"
+        fig.savefig(partial, format="png", dpi=100)
+        os.replace(partial, path)
+    finally:
+        plt.close(fig)
+    return path
+
+
+def _prune(directory: str, max_files: int):
+    paths = [
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.endswith(".png")
+    ]
+    if len(paths) <= max_files:
+        return
+    paths.sort(key=os.path.getmtime)
+    for path in paths[: len(paths) - max_files]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ChartRenderer:
+    """Renders charts in a process pool and keeps the PNGs on disk.
+
+    Files are named after a digest of the data they show, so an identical chart
+    is never drawn twice, even after a restart. Once the directory holds more
+    than CHART_CACHE_MAX_FILES charts the least recently used are removed.
+    """
+
+    def __init__(
+        self,
+        path=CHART_CACHE_DIR,
+        max_files=CHART_CACHE_MAX_FILES,
+        workers=CHART_WORKERS,
+    ):
+        self.path = path
+        self.max_files = max_files
+        self.workers = workers
+        self._pool = None
+        self.rendered = 0
+        self.reused = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            os.makedirs(self.path, exist_ok=True)
+            # Workers are spawned rather than forked from the running bot, whose
+            # threads and event loop a fork would copy mid-flight
+            self._pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def render(self, data: dict, days: int) -> str:
+        """Return the path of the chart for `data`, drawing it if needed."""
+        pool = self._get_pool()
+        path = os.path.join(self.path, f"{data_digest(data, days)}.png")
+        if os.path.exists(path):
+            self.reused += 1
+            # Touched so pruning keeps charts that are still asked for
+            os.utime(path)
+            return path
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(pool, render_chart_png, data, days, path)
+        except BrokenProcessPool:
+            # A worker died, start a new pool for the next chart
+            logger.exception("Chart worker pool broke")
+            self._pool = None
+            raise
+        self.rendered += 1
+        await asyncio.to_thread(_prune, self.path, self.max_files)
+        return path
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+charts = ChartRenderer()
@@ -1,10 +1,58 @@
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-from supabase import Client, create_client
+from metrics import SUPABASE_ERRORS, SUPABASE_SECONDS
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+# Maximum number of Supabase requests in flight at once, the rest wait their turn
+DB_MAX_CONCURRENCY = int(os.environ.get("DB_MAX_CONCURRENCY", "8"))
 
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Created on first use, so importing the bot doesn't load the Supabase SDK or need
+# its settings
+_client = None
+
+
+def get_client():
+    """Return the Supabase client, creating it the first time it's needed."""
+    global _client
+    if _client is None:
+        from supabase import create_client
+
+        _client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _client
+
+
+# The Supabase client is synchronous, so its requests run on this pool instead of
+# the event loop
+_executor = ThreadPoolExecutor(
+    max_workers=DB_MAX_CONCURRENCY, thread_name_prefix="supabase"
+)
+
+
+_OPERATIONS = {"GET": "select", "PATCH": "update", "DELETE": "delete"}
+
+
+def _describe(query) -> tuple[str, str]:
+    """Return the table (or function) and operation of a query, for metrics."""
+    path = query.path.lstrip("/")
+    if path.startswith("rpc/"):
+        return path[len("rpc/") :], "rpc"
+    if query.http_method == "POST":
+        merge = "resolution=" in query.headers.get("prefer", "")
+        return path, "upsert" if merge else "insert"
+    return path, _OPERATIONS.get(query.http_method, query.http_method.lower())
+
+
+async def execute(query):
+    """Run a query builder's blocking execute() without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    table, operation = _describe(query)
+    try:
+        with SUPABASE_SECONDS.time(table=table, operation=operation):
+            return await loop.run_in_executor(_executor, query.execute)
+    except Exception:
+        SUPABASE_ERRORS.inc(table=table, operation=operation)
+        raise
@@ -0,0 +1,65 @@
+import logging
+import os
+import time
+from collections import deque
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Bounds for the update_ids remembered to spot updates Telegram delivers again
+DEDUP_WINDOW_SIZE = int(os.environ.get("DEDUP_WINDOW_SIZE", "10000"))
+DEDUP_WINDOW_SECONDS = float(os.environ.get("DEDUP_WINDOW_SECONDS", "3600"))
+
+DUPLICATE_UPDATES = Counter(
+    "sleeptracker_duplicate_updates_total",
+    "Updates dropped because they were already handled",
+)
+
+
+class UpdateDeduplicator:
+    """Drops updates whose update_id was already seen, before any handler runs.
+
+    Telegram delivers a webhook update again when the response is slow, which
+    would repeat its handler's writes. The ids seen in the last
+    DEDUP_WINDOW_SECONDS, at most DEDUP_WINDOW_SIZE of them, are kept in a ring
+    buffer in arrival order with a set for lookups. Registered in group -1 so it
+    runs ahead of the conversation handler.
+    """
+
+    def __init__(self, max_size=DEDUP_WINDOW_SIZE, window=DEDUP_WINDOW_SECONDS):
+        self.window = window
+        # (seen_at, update_id), oldest first
+        self._order: deque[tuple[float, int]] = deque(maxlen=max_size)
+        self._seen: set[int] = set()
+        self.suppressed = 0
+
+    def _expire(self, now: float):
+        while self._order and (
+            self._order[0][0] < now - self.window
+            or len(self._order) == self._order.maxlen
+        ):
+            self._seen.discard(self._order.popleft()[1])
+
+    def seen(self, update_id: int) -> bool:
+        """Return True if the update was seen before, else remember it."""
+        if update_id in self._seen:
+            return True
+        now = time.monotonic()
+        self._expire(now)
+        self._order.append((now, update_id))
+        self._seen.add(update_id)
+        return False
+
+    async def check(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if self.seen(update.update_id):
+            self.suppressed += 1
+            DUPLICATE_UPDATES.inc()
+            logger.info("Dropped duplicate update %d", update.update_id)
+            raise ApplicationHandlerStop
+
+
+deduplicator = UpdateDeduplicator()
@@ -0,0 +1,195 @@
+import asyncio
+import itertools
+import logging
+import os
+from datetime import date, datetime, time, timedelta
+
+from telegram import Bot
+from telegram.error import Forbidden, TelegramError
+from telegram.ext import ContextTypes
+
+from aggregates import Totals
+from database import execute, get_client
+from date_utils import TIMEZONE
+from models import SleepRecord
+from rate_limiter import BACKGROUND
+from reports import render_weekly_digest
+from stats import Summary
+
+logger = logging.getLogger(__name__)
+
+# Day of the week (0 is Sunday, as the job queue counts) and local time the weekly
+# digest is sent, covering the seven days up to and including that day
+DIGEST_DAY = int(os.environ.get("DIGEST_DAY", "0"))
+DIGEST_TIME = time.fromisoformat(os.environ.get("DIGEST_TIME", "18:00"))
+# Users whose records are read per batch
+DIGEST_BATCH_SIZE = int(os.environ.get("DIGEST_BATCH_SIZE", "200"))
+# Digests sent at once, progress is saved after each group so a restart resends
+# at most this many
+DIGEST_SEND_GROUP = int(os.environ.get("DIGEST_SEND_GROUP", "20"))
+# Records per request when reading a batch's week of records
+DIGEST_RECORDS_PAGE_SIZE = 1000
+# Seconds after startup an interrupted digest run is picked up again
+DIGEST_RESUME_DELAY = 30
+# Key in bot_data of the progress of the current run, saved with the persistence
+DIGEST_STATE_KEY = "weekly_digest"
+
+
+def group_by_user(rows: list[dict]) -> dict[int, list[SleepRecord]]:
+    """Group rows ordered by user_id into each user's records, in one pass."""
+    return {
+        user_id: sorted(
+            (SleepRecord.from_row(row) for row in user_rows), key=lambda r: r.date
+        )
+        for user_id, user_rows in itertools.groupby(rows, key=lambda r: r["user_id"])
+    }
+
+
+def week_summary(records: list[SleepRecord]) -> Summary | None:
+    """Summarise a user's records for the digest, None if there are none."""
+    totals = Totals()
+    for record in records:
+        totals.add(Totals.from_record(record))
+    return totals.summary()
+
+
+class WeeklyDigest:
+    """Sends every registered user a summary of their past week.
+
+    Users are read from `users` in batches by id, and each batch's records for the
+    week with as few requests as fit DIGEST_RECORDS_PAGE_SIZE rows, so a run costs
+    a handful of queries per DIGEST_BATCH_SIZE users rather than one per user.
+    Messages go out at background priority through the rate limiter.
+
+    Digests are sent DIGEST_SEND_GROUP at a time. After each group the last user
+    id sent to is saved in bot_data and written out with the persistence, so a
+    run interrupted by a restart continues after the last saved group. Users in a
+    group that was only partly sent when the bot stopped may get their digest
+    twice.
+    """
+
+    def __init__(self, batch_size=DIGEST_BATCH_SIZE, group_size=DIGEST_SEND_GROUP):
+        self.batch_size = batch_size
+        self.group_size = group_size
+        self._running = False
+        self.sent = 0
+        self.failed = 0
+
+    async def _users_after(self, last_id: int | None) -> list[int]:
+        query = get_client().table("users").select("id")
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        response = await execute(query.order("id").limit(self.batch_size))
+        return [row["id"] for row in response.data]
+
+    async def _records_for(
+        self, user_ids: list[int], start: date, end: date
+    ) -> dict[int, list[SleepRecord]]:
+        """Return the submitted records of the given users between start and end.
+
+        Pages through records ordered by user_id, keyed on the last user in the
+        page. A user whose records were cut off by the page limit is read again
+        whole with the next page.
+        """
+        records = {}
+        last_id = user_ids[0] - 1
+        while True:
+            response = await execute(
+                get_client()
+                .table("sleep_records")
+                .select("*")
+                .gt("user_id", last_id)
+                .lte("user_id", user_ids[-1])
+                .gte("date", start.isoformat())
+                .lte("date", end.isoformat())
+                .eq("is_submitted", True)
+                .order("user_id")
+                .limit(DIGEST_RECORDS_PAGE_SIZE)
+            )
+            rows = response.data
+            if len(rows) < DIGEST_RECORDS_PAGE_SIZE:
+                records.update(group_by_user(rows))
+                return records
+            cut_off = rows[-1]["user_id"]
+            complete = [row for row in rows if row["user_id"] != cut_off]
+            if not complete:
+                raise RuntimeError(f"User {cut_off} has more records than a page")
+            records.update(group_by_user(complete))
+            last_id = complete[-1]["user_id"]
+
+    async def _send(self, bot: Bot, user_id: int, text: str):
+        try:
+            await bot.send_message(
+                chat_id=user_id,
+                text=text,
+                parse_mode="Markdown",
+                rate_limit_args={"priority": BACKGROUND},
+            )
+            self.sent += 1
+        except Forbidden:
+            # The user blocked the bot
+            self.failed += 1
+        except TelegramError as e:
+            self.failed += 1
+            logger.warning("Failed to send the weekly digest to %s: %s", user_id, e)
+
+    async def send_all(self, context: ContextTypes.DEFAULT_TYPE, state: dict):
+        """Send the digests of the run in `state`, from where it left off."""
+        end = date.fromisoformat(state["week_end"])
+        start = end - timedelta(days=6)
+        while True:
+            user_ids = await self._users_after(state["last_user_id"])
+            if not user_ids:
+                break
+            records = await self._records_for(user_ids, start, end)
+            for i in range(0, len(user_ids), self.group_size):
+                group = user_ids[i : i + self.group_size]
+                messages = []
+                for user_id in group:
+                    week = records.get(user_id, [])
+                    text = render_weekly_digest(week, week_summary(week), start, end)
+                    messages.append(self._send(context.bot, user_id, text))
+                await asyncio.gather(*messages)
+                state["last_user_id"] = group[-1]
+                # Saved now rather than with the next periodic persistence run
+                await context.application.update_persistence()
+            if len(user_ids) < self.batch_size:
+                break
+        state["done"] = True
+        await context.application.update_persistence()
+        logger.info("Weekly digest for %s sent to %d users", end, self.sent)
+
+    async def _run(self, context: ContextTypes.DEFAULT_TYPE, state: dict):
+        if self._running:
+            return
+        self._running = True
+        try:
+            await self.send_all(context, state)
+        finally:
+            self._running = False
+
+    async def run(self, context: ContextTypes.DEFAULT_TYPE):
+        """Start this week's run, run by the job queue on DIGEST_DAY."""
+        week_end = datetime.now(TIMEZONE).date()
+        state = context.bot_data.get(DIGEST_STATE_KEY)
+        if state is None or state["week_end"] != week_end.isoformat():
+            state = {
+                "week_end": week_end.isoformat(),
+                "last_user_id": None,
+                "done": False,
+            }
+            context.bot_data[DIGEST_STATE_KEY] = state
+        if not state["done"]:
+            await self._run(context, state)
+
+    async def resume(self, context: ContextTypes.DEFAULT_TYPE):
+        """Finish a run the bot was stopped in the middle of, run once at startup."""
+        state = context.bot_data.get(DIGEST_STATE_KEY)
+        if state and not state["done"]:
+            logger.info(
+                "Resuming the weekly digest after user %s", state["last_user_id"]
+            )
+            await self._run(context, state)
+
+
+weekly_digest = WeeklyDigest()
@@ -0,0 +1,39 @@
+import asyncio
+import csv
+import io
+from typing import BinaryIO
+
+from repository import sleep_records
+
+# Columns of an export, in order. /import accepts files with the same header
+EXPORT_COLUMNS = (
+    "date",
+    "bed_time",
+    "sleep_time",
+    "first_alarm_time",
+    "wakeup_time",
+    "energy_score",
+    "clarity_score",
+)
+
+
+async def write_history_csv(user_id: int, file: BinaryIO) -> int:
+    """Write all of a user's submitted records to `file` as CSV, oldest first.
+
+    History is read a page at a time and each page is encoded on a worker thread
+    before the next is fetched, so memory use doesn't grow with the history and
+    encoding doesn't hold up the event loop. Returns the number of records.
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8", newline="")
+    writer = csv.DictWriter(text, EXPORT_COLUMNS)
+    await asyncio.to_thread(writer.writeheader)
+    count = 0
+    async for rows in sleep_records.iter_history_rows(
+        user_id, columns=",".join(EXPORT_COLUMNS)
+    ):
+        await asyncio.to_thread(writer.writerows, rows)
+        count += len(rows)
+    text.flush()
+    # Leave the binary file open for the caller
+    text.detach()
+    return count
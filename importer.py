@@ -0,0 +1,148 @@
+import csv
+import io
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+
+from date_utils import TIMEZONE
+from exports import EXPORT_COLUMNS
+from models import SleepForm
+from parsers import (
+    parse_24_hour_time_format,
+    parse_date,
+    parse_datetime_string,
+    parse_duration,
+)
+
+# Largest file /import accepts
+MAX_IMPORT_BYTES = 5 * 1024 * 1024
+# Number of invalid rows described in the reply, the rest are only counted
+MAX_REPORTED_ERRORS = 5
+
+
+@dataclass
+class ParsedImport:
+    """Rows of an uploaded history file, validated and ready to insert."""
+
+    rows: list[dict] = field(default_factory=list)
+    skipped: int = 0
+    errors: list[str] = field(default_factory=list)
+
+    def skip(self, line: int, reason: str):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Row {line}: {reason}")
+
+
+def _parse_score(value: str) -> int:
+    if not value.strip().isdigit() or not 1 <= int(value) <= 5:
+        raise ValueError(f"score {value!r} is not between 1 and 5")
+    return int(value)
+
+
+def _parse_timestamp(value: str) -> datetime:
+    try:
+        return parse_datetime_string(value)
+    except ValueError:
+        raise ValueError(f"invalid timestamp {value!r}")
+
+
+def _parse_time(value: str, column: str) -> time:
+    parsed = parse_24_hour_time_format(value.strip())
+    if not parsed:
+        raise ValueError(f"invalid {column} {value!r}, expected 24-hour HHMM")
+    return parsed
+
+
+def _export_row_form(row: dict) -> SleepForm:
+    """Read a row in the layout written by /export."""
+    sleep_date = parse_date(row["date"])
+    if not sleep_date:
+        raise ValueError(f"invalid date {row['date']!r}")
+    bedtime = _parse_timestamp(row["bed_time"])
+    return SleepForm(
+        sleep_date=sleep_date,
+        bedtime=bedtime,
+        fall_asleep=_parse_timestamp(row["sleep_time"]) - bedtime,
+        alarm=_parse_timestamp(row["first_alarm_time"]),
+        wakeup=_parse_timestamp(row["wakeup_time"]),
+        energy=_parse_score(row["energy_score"]),
+        clarity=_parse_score(row["clarity_score"]),
+    )
+
+
+def _legacy_row_form(row: list[str]) -> SleepForm:
+    """Read a row in the layout of the Google Sheet, columns A-G.
+
+    Columns are the date, bedtime, wake-up time, time to fall asleep, alarm time
+    and the energy and clarity scores. The old sheet only had the first four, and
+    rows without the rest are rejected rather than saved with made-up values.
+    """
+    if len(row) < 4:
+        raise ValueError("expected date, bedtime, wake-up time and time to fall asleep")
+    if len(row) < 7 or not all(cell.strip() for cell in row[4:7]):
+        raise ValueError("missing the alarm time, energy or clarity score")
+    sleep_date = parse_date(row[0].strip())
+    if not sleep_date:
+        raise ValueError(f"invalid date {row[0]!r}")
+    bedtime = _parse_time(row[1], "bedtime")
+    # Bedtimes from 8pm are on the evening before, as in the bedtime edit
+    bed_date = sleep_date - timedelta(days=1) if bedtime >= time(20, 0) else sleep_date
+    fall_asleep = parse_duration(row[3])
+    if fall_asleep is None:
+        raise ValueError(f"invalid time to fall asleep {row[3]!r}")
+    wakeup = _parse_time(row[2], "wake-up time")
+    alarm = _parse_time(row[4], "alarm time")
+    return SleepForm(
+        sleep_date=sleep_date,
+        bedtime=TIMEZONE.localize(datetime.combine(bed_date, bedtime)),
+        fall_asleep=fall_asleep,
+        alarm=TIMEZONE.localize(datetime.combine(sleep_date, alarm)),
+        wakeup=TIMEZONE.localize(datetime.combine(sleep_date, wakeup)),
+        energy=_parse_score(row[5]),
+        clarity=_parse_score(row[6]),
+    )
+
+
+def parse_history_csv(data: bytes, user_id: int, today: date) -> ParsedImport:
+    """Validate an uploaded CSV and turn its rows into `sleep_records` rows.
+
+    Accepts files written by /export, with a header row, or rows in the Google
+    Sheet layout. Invalid or incomplete rows, future dates and repeated dates are
+    skipped.
+    """
+    text = data.decode("utf-8-sig")
+    lines = list(csv.reader(io.StringIO(text)))
+    result = ParsedImport()
+    if not lines:
+        return result
+
+    header = [column.strip() for column in lines[0]]
+    is_export = set(EXPORT_COLUMNS) <= set(header)
+    # The sheet layout may or may not have a header row
+    start = 0 if not is_export and header and parse_date(header[0]) else 1
+
+    seen = set()
+    for line_number, line in enumerate(lines[start:], start=start + 1):
+        if not any(cell.strip() for cell in line):
+            continue
+        try:
+            if is_export:
+                form = _export_row_form(dict(zip(header, line)))
+            else:
+                form = _legacy_row_form(line)
+        except (KeyError, ValueError) as e:
+            result.skip(line_number, str(e))
+            continue
+        if form.sleep_date > today:
+            result.skip(line_number, f"{form.sleep_date} is in the future")
+        elif (
+            form.fall_asleep < timedelta(0)
+            or form.wakeup <= form.bedtime + form.fall_asleep
+        ):
+            result.skip(line_number, "wake-up time is not after falling asleep")
+        elif form.sleep_date in seen:
+            result.skip(line_number, f"{form.sleep_date} appears more than once")
+        else:
+            seen.add(form.sleep_date)
+            result.rows.append(form.to_row(user_id))
+    return result
@@ -1,19 +1,26 @@
+import asyncio
+import csv
 import logging
 import os
+import tempfile
 from datetime import datetime, time, timedelta
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
     CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
     ConversationHandler,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 
-from database import supabase
+from aggregates import aggregates
+from charts import chart_data, charts
+from database import execute, get_client
 from date_utils import (
     TIMEZONE,
     can_record_sleep_now,
@@ -27,12 +34,29 @@ from date_utils import (
     get_readable_time,
     get_sleep_date,
 )
-from parsers import (
-    parse_24_hour_time_format,
-    parse_datetime_string,
-    parse_day_month_format,
-    parse_duration,
+from dedup import deduplicator
+from digest import DIGEST_DAY, DIGEST_RESUME_DELAY, DIGEST_TIME, weekly_digest
+from exports import write_history_csv
+from importer import MAX_IMPORT_BYTES, parse_history_csv
+from metrics import Gauge, instrument_handler
+from models import SleepForm
+from parsers import parse_24_hour_time_format, parse_day_month_format, parse_duration
+from persistence import SQLitePersistence
+from profiling import PROFILE_ADMIN_IDS, PROFILE_FLUSH_INTERVAL, profiler
+from rate_limiter import PriorityRateLimiter
+from reminders import BEDTIME, REMINDER_TICK, WAKEUP, reminders
+from reports import (
+    VIEW_DETAIL_RECORDS,
+    chart_paths,
+    render_sleep_form,
+    render_trends_report,
+    render_view_report,
+    view_reports,
 )
+from repository import sleep_records
+from sheets import SHEETS_FLUSH_INTERVAL, sheets_mirror
+from stats import ROW_COLUMNS, SLEEP_TARGET_HOURS, SleepColumns, compute_trends
+from update_processor import UPDATE_CONCURRENCY, PerUserUpdateProcessor
 
 # Set up logging
 logging.basicConfig(
@@ -46,6 +70,8 @@ WEBHOOK_URL = os.environ.get("WEBHOOK_URL")
 TELEBOT_TOKEN = os.environ.get("TELEBOT_TOKEN")
 SECRET_TOKEN = os.environ.get("SECRET_TOKEN")
 PORT = int(os.environ.get("PORT", "8000"))
+PERSISTENCE_PATH = os.environ.get("PERSISTENCE_PATH", "sleeptracker.sqlite")
+PERSISTENCE_INTERVAL = float(os.environ.get("PERSISTENCE_INTERVAL", "30"))
 
 
 # Conversation states
@@ -58,6 +84,23 @@ EDIT_ENERGY_SCORE = 5
 EDIT_CLARITY_SCORE = 6
 EDIT_FORM = 7
 ADD_ENTRY = 8
+IMPORT_FILE = 9
+STATE_NAMES = {
+    WAKEUP_FORM: "WAKEUP_FORM",
+    EDIT_BEDTIME: "EDIT_BEDTIME",
+    EDIT_FALL_ASLEEP: "EDIT_FALL_ASLEEP",
+    EDIT_ALARM: "EDIT_ALARM",
+    EDIT_WAKEUP_TIME: "EDIT_WAKEUP_TIME",
+    EDIT_ENERGY_SCORE: "EDIT_ENERGY_SCORE",
+    EDIT_CLARITY_SCORE: "EDIT_CLARITY_SCORE",
+    EDIT_FORM: "EDIT_FORM",
+    ADD_ENTRY: "ADD_ENTRY",
+    IMPORT_FILE: "IMPORT_FILE",
+    ConversationHandler.END: "END",
+}
+
+# Number of days /view can look back
+VIEW_WINDOWS = (7, 30, 90, 365)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -67,7 +110,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     username = user.username or user.first_name
 
     # Register user in DB if not already present
-    supabase.table("users").upsert({"id": user_id, "username": username}).execute()
+    await execute(
+        get_client().table("users").upsert({"id": user_id, "username": username})
+    )
 
     await update.message.reply_text(
         f"Hello {username}! I'm a sleep tracker bot to help you track and review your sleep patterns.\n\n"
@@ -83,9 +128,15 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "/start - Start the bot\n"
         "/sleep - Record your bedtime\n"
         "/wakey - Record your wake-up time\n"
-        "/view - View your sleep records for the past 7 days\n"
+        "/view - View your sleep records for the past 7 days (or /view 30, 90, 365)\n"
+        "/chart - Chart your sleep for the past 7 days (or /chart 30, 90, 365)\n"
+        "/trends - See trends, sleep debt and score correlations over all your records\n"
         "/edit - Edit a sleep record\n"
         "/add - Add a new sleep record for a specific date\n"
+        "/export - Download all your sleep records as a CSV file\n"
+        "/import - Add sleep records in bulk from a CSV file\n"
+        "/rebuild_stats - Recompute your statistics from your sleep records\n"
+        "/remind - Get daily reminders to log your sleep, eg /remind bedtime 2230\n"
         "/help - View this help message"
     )
 
@@ -103,15 +154,9 @@ async def sleep_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         return ConversationHandler.END
 
     sleep_date = get_sleep_date(cur_datetime)
-    response = (
-        supabase.table("sleep_records")
-        .select("*")
-        .eq("user_id", user_id)
-        .eq("date", sleep_date)
-        .execute()
-    )
+    record = await sleep_records.record_bedtime(user_id, sleep_date, cur_datetime)
 
-    if response.data:
+    if not record:
         await update.message.reply_text(
             f"You already logged bedtime for {get_readable_date(sleep_date)} "
             "(sleep date = date which user wakes up, not when bedtime is recorded).\n"
@@ -119,24 +164,6 @@ async def sleep_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         )
         return ConversationHandler.END
 
-    response = (
-        supabase.table("sleep_records")
-        .insert(
-            {
-                "user_id": user_id,
-                "date": sleep_date.isoformat(),
-                "bed_time": cur_datetime.isoformat(),
-            }
-        )
-        .execute()
-    )
-
-    if not response.data:
-        await update.message.reply_text(
-            "Oops! Something went wrong, please try again later."
-        )
-        return ConversationHandler.END
-
     await update.message.reply_text(
         f"Recorded bedtime at {get_readable_time(cur_datetime)}, good night! 😴"
     )
@@ -157,72 +184,43 @@ async def wakey_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         return ConversationHandler.END
 
     sleep_date = get_sleep_date(cur_datetime)
-    response = (
-        supabase.table("sleep_records")
-        .select("*")
-        .eq("user_id", user_id)
-        .eq("date", sleep_date)
-        .execute()
-    )
-
-    if not response.data:
-        # Create a new record with default bedtime if it doesn't exist
-        default_bedtime = get_default_bedtime(cur_datetime)
-
-        supabase.table("sleep_records").insert(
-            {
-                "user_id": user_id,
-                "date": sleep_date.isoformat(),
-                "bed_time": default_bedtime.isoformat(),
-                "wakeup_time": cur_datetime.isoformat(),
-            }
-        ).execute()
-        context.user_data["bedtime"] = default_bedtime
-    else:
-        if response.data[0]["is_submitted"]:
-            await update.message.reply_text(
-                f"You already logged wakeup time for {get_readable_date(sleep_date)}.\n"
-                "Please use /edit instead to change it."
-            )
-            return ConversationHandler.END
-        # Else update existing record
-        supabase.table("sleep_records").update(
-            {
-                "wakeup_time": cur_datetime.isoformat(),
-            }
-        ).eq("user_id", user_id).eq("date", sleep_date).execute()
-        context.user_data["bedtime"] = parse_datetime_string(
-            response.data[0]["bed_time"]
+    # Creates the record with a default bedtime if it doesn't exist, otherwise sets
+    # the wake-up time of the existing record unless it was already submitted
+    record = await sleep_records.record_wakeup(
+        user_id, sleep_date, get_default_bedtime(cur_datetime), cur_datetime
+    )
+
+    if not record:
+        await update.message.reply_text(
+            f"You already logged wakeup time for {get_readable_date(sleep_date)}.\n"
+            "Please use /edit instead to change it."
         )
+        return ConversationHandler.END
 
     # Prepare form
-    context.user_data["sleep_date"] = sleep_date
-    context.user_data["fall_asleep"] = parse_duration("15m")
-    context.user_data["alarm"] = get_default_alarm_time(cur_datetime)
-    context.user_data["wakeup"] = cur_datetime
-    context.user_data["energy"] = 3
-    context.user_data["clarity"] = 3
+    context.user_data["form"] = SleepForm(
+        sleep_date=sleep_date,
+        bedtime=record.bed_time,
+        fall_asleep=parse_duration("15m"),
+        alarm=get_default_alarm_time(cur_datetime),
+        wakeup=cur_datetime,
+    )
 
     await send_sleep_form(update, context, new_message=True)
     return WAKEUP_FORM
 
 
 async def send_sleep_form(
-    update: Update, context: ContextTypes.DEFAULT_TYPE, new_message=True
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    new_message=True,
+    notice: str | None = None,
 ):
-
-    data = context.user_data
-
-    text = (
-        f"🛌 **{'New ' if context.user_data.get('add_entry', None) else ''}Sleep Record for {get_readable_date(data['sleep_date'])}**\n\n"
-        f"- 🛏️ Bedtime: {get_readable_time(data['bedtime'])}\n"
-        f"- ⏱️ Time to fall asleep: {get_readable_duration(data['fall_asleep'])}\n"
-        f"- ⏰ First alarm: {get_readable_time(data['alarm'])}\n"
-        f"- 🌅 Wake-up time: {get_readable_time(data['wakeup'])}\n"
-        f"- ⚡ Energy score: {data['energy']}\n"
-        f"- 🧠 Clarity score: {data['clarity']}\n\n"
-        "🔽 *Tap to edit:*"
-    )
+    """Send the form, or update the form message in place unless nothing changed."""
+    form = context.user_data["form"]
+    text = render_sleep_form(form, notice)
+    # Compared without the notice, so an edit to the same value sends nothing
+    shown = render_sleep_form(form)
 
     keyboard = [
         [
@@ -241,81 +239,82 @@ async def send_sleep_form(
     ]
     markup = InlineKeyboardMarkup(keyboard)
 
-    if new_message:
-        await update.message.reply_text(
+    if new_message or form.message_id is None:
+        message = await update.effective_message.reply_text(
             text, reply_markup=markup, parse_mode="Markdown"
         )
-    else:
-        await update.callback_query.edit_message_text(
-            text=text, reply_markup=markup, parse_mode="Markdown"
+        form.message_id = message.message_id
+    elif shown != form.text:
+        await context.bot.edit_message_text(
+            text=text,
+            chat_id=update.effective_chat.id,
+            message_id=form.message_id,
+            reply_markup=markup,
+            parse_mode="Markdown",
         )
+    form.text = shown
+
+
+# Prompt, form field and next state for each edit button. The prompt is shown as
+# the button's notification so the form message stays as it is
+FORM_EDITS = {
+    "edit_bedtime": (
+        "Please send your new bedtime in 24-hour format (eg 2230 for 10.30pm, or 0015 for 12.15am).",
+        "bedtime",
+        EDIT_BEDTIME,
+    ),
+    "edit_fall_asleep": (
+        "Please send the time taken to fall asleep following the example formats. (eg 15m for 15 mins, 1h30m for 1 hr 30 mins).",
+        "fall_asleep",
+        EDIT_FALL_ASLEEP,
+    ),
+    "edit_alarm": (
+        "Please send your new alarm time in 24-hour format (eg 2230 for 10.30pm, or 0015 for 12.15am).",
+        "alarm",
+        EDIT_ALARM,
+    ),
+    "edit_wakeup": (
+        "Please send your new wake-up time 24-hour format (eg 2230 for 10.30pm, or 0015 for 12.15am).",
+        "wakeup",
+        EDIT_WAKEUP_TIME,
+    ),
+    "edit_energy": (
+        "Please rate your energy score from 1 to 5 (1 being very tired, 5 being very energetic).",
+        "energy",
+        EDIT_ENERGY_SCORE,
+    ),
+    "edit_clarity": (
+        "Please send your clarity score from 1 to 5 (1 being bad brainfog, 5 being very clear minded).",
+        "clarity",
+        EDIT_CLARITY_SCORE,
+    ),
+}
 
 
 # Function to handle the edit action for each form field
 async def handle_form_edit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     # Wait for user to select a callback button
     query = update.callback_query
-    await query.answer()
     action = query.data
+    form = context.user_data["form"]
+    # Edits go to the form whose button was pressed
+    form.message_id = query.message.message_id
 
-    if action == "edit_bedtime":
-        await query.edit_message_text(
-            "Please send your new bedtime in 24-hour format (eg 2230 for 10.30pm, or 0015 for 12.15am)."
-        )
-        context.user_data["edit_field"] = "bedtime"
-        return EDIT_BEDTIME
+    if action in FORM_EDITS:
+        prompt, form.edit_field, state = FORM_EDITS[action]
+        await query.answer(prompt, show_alert=True)
+        return state
 
-    elif action == "edit_fall_asleep":
-        await query.edit_message_text(
-            "Please send the time taken to fall asleep following the example formats. (eg `15m` for 15 mins, `1h30m` for 1 hr 30 mins)."
-        )
-        context.user_data["edit_field"] = "fall_asleep"
-        return EDIT_FALL_ASLEEP
-
-    elif action == "edit_alarm":
-        await query.edit_message_text(
-            "Please send your new alarm time in 24-hour format (eg 2230 for 10.30pm, or 0015 for 12.15am)."
-        )
-        context.user_data["edit_field"] = "alarm"
-        return EDIT_ALARM
-
-    elif action == "edit_wakeup":
-        await query.edit_message_text(
-            "Please send your new wake-up time 24-hour format (eg 2230 for 10.30pm, or 0015 for 12.15am)."
-        )
-        context.user_data["edit_field"] = "wakeup"
-        return EDIT_WAKEUP_TIME
-
-    elif action == "edit_energy":
-        await query.edit_message_text(
-            "Please rate your energy score from 1 to 5 (1 being very tired, 5 being very energetic)."
-        )
-        context.user_data["edit_field"] = "energy"
-        return EDIT_ENERGY_SCORE
-
-    elif action == "edit_clarity":
-        await query.edit_message_text(
-            "Please send your clarity score from 1 to 5 (1 being bad brainfog, 5 being very clear minded)."
-        )
-        context.user_data["edit_field"] = "clarity"
-        return EDIT_CLARITY_SCORE
-
-    elif action == "submit_form":
+    await query.answer()
+    if action == "submit_form":
         # After the user submits, save data to database or finalize form
-        data = context.user_data
-        supabase.table("sleep_records").upsert(
-            {
-                "user_id": update.effective_user.id,
-                "date": data["sleep_date"].isoformat(),
-                "bed_time": data["bedtime"].isoformat(),
-                "sleep_time": (data["bedtime"] + data["fall_asleep"]).isoformat(),
-                "first_alarm_time": data["alarm"].isoformat(),
-                "wakeup_time": data["wakeup"].isoformat(),
-                "energy_score": data["energy"],
-                "clarity_score": data["clarity"],
-                "is_submitted": True,
-            }
-        ).execute()
+        user_id = update.effective_user.id
+        # Usually cached from when the form was opened
+        previous = await sleep_records.get(user_id, form.sleep_date)
+        record = await sleep_records.upsert(form.to_row(user_id))
+        aggregates.record_submitted(user_id, previous, record)
+        if record:
+            sheets_mirror.add([record])
         await query.edit_message_text("✅ Sleep record submitted!")
         return ConversationHandler.END
 
@@ -336,16 +335,19 @@ async def handle_edit_bedtime(
         return EDIT_BEDTIME  # Restart this function
 
     # Process and update context
-    sleep_date = context.user_data["sleep_date"]
+    form = context.user_data["form"]
+    sleep_date = form.sleep_date
     new_sleep_date = (
         sleep_date - timedelta(days=1) if valid_timestamp >= time(20, 0) else sleep_date
     )
     new_bedtime = TIMEZONE.localize(datetime.combine(new_sleep_date, valid_timestamp))
-    context.user_data["bedtime"] = new_bedtime
-    await update.message.reply_text(
-        f"Updated bedtime to {get_readable_time(new_bedtime)}. Remember to submit the form once done with all changes!"
+    form.bedtime = new_bedtime
+    await send_sleep_form(
+        update,
+        context,
+        new_message=False,
+        notice=f"Updated bedtime to {get_readable_time(new_bedtime)}. Remember to submit the form once done with all changes!",
     )
-    await send_sleep_form(update, context, new_message=True)
 
     return WAKEUP_FORM
 
@@ -364,11 +366,13 @@ async def handle_edit_fall_asleep(
         return EDIT_FALL_ASLEEP
 
     # Update context
-    context.user_data["fall_asleep"] = duration
-    await update.message.reply_text(
-        f"Updated time to fall asleep to {get_readable_duration(duration)}."
+    context.user_data["form"].fall_asleep = duration
+    await send_sleep_form(
+        update,
+        context,
+        new_message=False,
+        notice=f"Updated time to fall asleep to {get_readable_duration(duration)}.",
     )
-    await send_sleep_form(update, context, new_message=True)
 
     return WAKEUP_FORM
 
@@ -385,14 +389,15 @@ async def handle_edit_alarm(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return EDIT_ALARM
 
     # Process and update context
-    alarm_time = TIMEZONE.localize(
-        datetime.combine(context.user_data["sleep_date"], timestamp)
-    )
-    context.user_data["alarm"] = alarm_time
-    await update.message.reply_text(
-        f"Updated alarm time to {alarm_time.strftime('%I:%M %p').lower()}."
+    form = context.user_data["form"]
+    alarm_time = TIMEZONE.localize(datetime.combine(form.sleep_date, timestamp))
+    form.alarm = alarm_time
+    await send_sleep_form(
+        update,
+        context,
+        new_message=False,
+        notice=f"Updated alarm time to {alarm_time.strftime('%I:%M %p').lower()}.",
     )
-    await send_sleep_form(update, context, new_message=True)
 
     return WAKEUP_FORM
 
@@ -409,14 +414,15 @@ async def handle_edit_wakeup(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return EDIT_WAKEUP_TIME
 
     # Process and update context
-    wakeup_time = TIMEZONE.localize(
-        datetime.combine(context.user_data["sleep_date"], timestamp)
-    )
-    context.user_data["wakeup"] = wakeup_time
-    await update.message.reply_text(
-        f"Updated wake-up time to {wakeup_time.strftime('%I:%M %p').lower()}."
+    form = context.user_data["form"]
+    wakeup_time = TIMEZONE.localize(datetime.combine(form.sleep_date, timestamp))
+    form.wakeup = wakeup_time
+    await send_sleep_form(
+        update,
+        context,
+        new_message=False,
+        notice=f"Updated wake-up time to {wakeup_time.strftime('%I:%M %p').lower()}.",
     )
-    await send_sleep_form(update, context, new_message=True)
 
     return WAKEUP_FORM
 
@@ -433,9 +439,13 @@ async def handle_edit_energy(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     # Update context
     energy_score = int(user_input)
-    context.user_data["energy"] = energy_score
-    await update.message.reply_text(f"Updated energy score to {energy_score}.")
-    await send_sleep_form(update, context, new_message=True)
+    context.user_data["form"].energy = energy_score
+    await send_sleep_form(
+        update,
+        context,
+        new_message=False,
+        notice=f"Updated energy score to {energy_score}.",
+    )
 
     return WAKEUP_FORM
 
@@ -454,15 +464,18 @@ async def handle_edit_clarity(
 
     # Update context
     clarity_score = int(user_input)
-    context.user_data["clarity"] = clarity_score
-    await update.message.reply_text(f"Updated clarity score to {clarity_score}.")
-    await send_sleep_form(update, context, new_message=True)
+    context.user_data["form"].clarity = clarity_score
+    await send_sleep_form(
+        update,
+        context,
+        new_message=False,
+        notice=f"Updated clarity score to {clarity_score}.",
+    )
 
     return WAKEUP_FORM
 
 
 async def edit_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data["add_entry"] = False
     await update.message.reply_text(
         "Which date would you like to edit? (Format: DD/MM)"
     )
@@ -476,7 +489,6 @@ async def add_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
 
 async def handle_add_form_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Validate input
-    context.user_data["add_entry"] = True
     user_input = update.message.text.strip()
     day_month = parse_day_month_format(user_input)
     if not day_month:
@@ -486,14 +498,7 @@ async def handle_add_form_input(update: Update, context: ContextTypes.DEFAULT_TY
         return ADD_ENTRY
     year = datetime.now().year
     selected_date = day_month.replace(year=year)
-    response = (
-        supabase.table("sleep_records")
-        .select("*")
-        .eq("user_id", update.effective_user.id)
-        .eq("date", selected_date)
-        .execute()
-    )
-    if response.data:
+    if await sleep_records.get(update.effective_user.id, selected_date):
         await update.message.reply_text(
             f"Sleep log already exists for {get_readable_date(selected_date)}, please use /edit instead to change it."
         )
@@ -501,16 +506,14 @@ async def handle_add_form_input(update: Update, context: ContextTypes.DEFAULT_TY
 
     # Prepare default form
     default_bedtime = get_default_bedtime(selected_date)
-    default_sleep_time = get_default_sleep_time(selected_date)
-    default_alarm_time = get_default_alarm_time(selected_date)
-    default_wakeup = get_default_wakeup_time(selected_date)
-    context.user_data["bedtime"] = default_bedtime
-    context.user_data["sleep_date"] = selected_date
-    context.user_data["fall_asleep"] = default_sleep_time - default_bedtime
-    context.user_data["alarm"] = default_alarm_time
-    context.user_data["wakeup"] = default_wakeup
-    context.user_data["energy"] = 3
-    context.user_data["clarity"] = 3
+    context.user_data["form"] = SleepForm(
+        sleep_date=selected_date.date(),
+        bedtime=default_bedtime,
+        fall_asleep=get_default_sleep_time(selected_date) - default_bedtime,
+        alarm=get_default_alarm_time(selected_date),
+        wakeup=get_default_wakeup_time(selected_date),
+        is_new=True,
+    )
     await send_sleep_form(update, context, new_message=True)
 
     return WAKEUP_FORM
@@ -527,137 +530,362 @@ async def handle_edit_form_input(update: Update, context: ContextTypes.DEFAULT_T
         return EDIT_FORM  # Restart this function
     year = datetime.now().year
     selected_date = day_month.replace(year=year)
-    response = (
-        supabase.table("sleep_records")
-        .select("*")
-        .eq("user_id", update.effective_user.id)
-        .eq("date", selected_date)
-        .execute()
-    )
-    if not response.data:
+    entry = await sleep_records.get(update.effective_user.id, selected_date)
+    if not entry:
         await update.message.reply_text(
             "No sleep log found for that date. Please try again, or use /cancel to exit."
         )
         return EDIT_FORM
-    if not response.data[0]["is_submitted"]:
+    if not entry.is_submitted:
         await update.message.reply_text(
             "This sleep log has not been completed yet. Please use /wakey to submit it instead."
         )
         return ConversationHandler.END
 
     # Prepare form
-    entry = response.data[0]
-    bedtime = parse_datetime_string(entry["bed_time"])
-    sleep_time = parse_datetime_string(entry["sleep_time"])
-    alarm_time = parse_datetime_string(entry["first_alarm_time"])
-    wakeup_time = parse_datetime_string(entry["wakeup_time"])
-    context.user_data["sleep_date"] = selected_date
-    context.user_data["bedtime"] = bedtime
-    context.user_data["fall_asleep"] = sleep_time - bedtime
-    context.user_data["alarm"] = alarm_time
-    context.user_data["wakeup"] = wakeup_time
-    context.user_data["energy"] = entry["energy_score"]
-    context.user_data["clarity"] = entry["clarity_score"]
+    context.user_data["form"] = SleepForm.from_record(entry)
     await send_sleep_form(update, context, new_message=True)
 
     return WAKEUP_FORM
 
 
 async def view_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """View sleep statistics for the past 7 days."""
+    """View sleep statistics for the past 7, 30, 90 or 365 days."""
     user_id = update.effective_user.id
 
+    days = VIEW_WINDOWS[0]
+    if context.args:
+        if not context.args[0].isdigit() or int(context.args[0]) not in VIEW_WINDOWS:
+            await update.message.reply_text(
+                "Please choose to view the past 7, 30, 90 or 365 days, eg /view 30."
+            )
+            return ConversationHandler.END
+        days = int(context.args[0])
+
+    report = await get_view_report(user_id, days)
+    if not report:
+        await update.message.reply_text(
+            f"No sleep records found for the past {days} days."
+        )
+        return ConversationHandler.END
+
+    await update.message.reply_text(report, parse_mode="Markdown")
+
+
+async def get_view_report(user_id: int, days: int) -> str | None:
+    """Build the /view report for the past `days` days, None if there are no records."""
     # Calculate date range
     end_date = datetime.now(TIMEZONE).date()
-    start_date = end_date - timedelta(days=6)  # 7 days including today
+    start_date = end_date - timedelta(days=days - 1)  # Including today
+
+    # Reports are reused until the user's records are written or the day changes
+    stamp = (end_date, sleep_records.version(user_id))
+    found, report = view_reports.get((user_id, days), stamp)
+    if found:
+        return report
+
+    summary = await aggregates.summary(user_id, days, end_date)
+    if summary:
+        # Only the latest records are listed in full, averages come from the
+        # aggregates
+        records = await sleep_records.list_range(
+            user_id, start_date, end_date, limit=VIEW_DETAIL_RECORDS
+        )
+        latest = SleepColumns.from_records(records)
+        report = render_view_report(latest, summary, days)
+    view_reports.put((user_id, days), stamp, report)
+    return report
+
+
+async def trends_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Show trends over the user's whole history, against an optional target."""
+    user_id = update.effective_user.id
+
+    target_hours = SLEEP_TARGET_HOURS
+    if context.args:
+        try:
+            target_hours = float(context.args[0])
+        except ValueError:
+            target_hours = 0
+        if not 3 <= target_hours <= 14:
+            await update.message.reply_text(
+                "Please give a target between 3 and 14 hours of sleep, eg /trends 7.5."
+            )
+            return ConversationHandler.END
+
+    report = await get_trends_report(user_id, target_hours)
+    if not report:
+        await update.message.reply_text("No sleep records found yet.")
+        return ConversationHandler.END
+
+    await update.message.reply_text(report, parse_mode="Markdown")
+    return ConversationHandler.END
+
+
+async def chart_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Send a chart of bedtimes, wake-up times and durations for a past window."""
+    user_id = update.effective_user.id
+
+    days = VIEW_WINDOWS[0]
+    if context.args:
+        if not context.args[0].isdigit() or int(context.args[0]) not in VIEW_WINDOWS:
+            await update.message.reply_text(
+                "Please choose to chart the past 7, 30, 90 or 365 days, eg /chart 30."
+            )
+            return ConversationHandler.END
+        days = int(context.args[0])
+
+    try:
+        path = await get_chart(user_id, days)
+    except Exception:
+        # Eg a chart worker died (BrokenProcessPool) or matplotlib failed to draw
+        logger.exception("Failed to draw the %d day chart for user %s", days, user_id)
+        await update.message.reply_text(
+            "Sorry, I couldn't draw the chart right now. Please try again later."
+        )
+        return ConversationHandler.END
+
+    if not path:
+        await update.message.reply_text(
+            f"No sleep records found for the past {days} days."
+        )
+        return ConversationHandler.END
+
+    with open(path, "rb") as f:
+        await update.message.reply_photo(f)
+    return ConversationHandler.END
+
+
+async def get_chart(user_id: int, days: int) -> str | None:
+    """Return the path of the /chart image for the past `days` days, None if empty."""
+    end_date = datetime.now(TIMEZONE).date()
+    start_date = end_date - timedelta(days=days - 1)  # Including today
+
+    stamp = (end_date, sleep_records.version(user_id))
+    found, path = chart_paths.get((user_id, days), stamp)
+    if found and (path is None or os.path.exists(path)):
+        return path
+
+    # The records /view lists, for the whole window
+    records = await sleep_records.list_range(user_id, start_date, end_date)
+    data = chart_data(records)
+    path = await charts.render(data, days) if data["dates"] else None
+    chart_paths.put((user_id, days), stamp, path)
+    return path
+
+
+def build_trends_report(rows: list[dict], today, target_hours: float) -> str | None:
+    trends = compute_trends(SleepColumns.from_rows(rows), today, target_hours)
+    return render_trends_report(trends, target_hours) if trends else None
+
+
+async def get_trends_report(user_id: int, target_hours: float) -> str | None:
+    """Build the /trends report, None if the user has no records."""
+    today = datetime.now(TIMEZONE).date()
+    stamp = (today, sleep_records.version(user_id))
+    found, report = view_reports.get((user_id, "trends", target_hours), stamp)
+    if found:
+        return report
+
+    rows = []
+    async for page in sleep_records.iter_history_rows(user_id, columns=ROW_COLUMNS):
+        rows.extend(page)
+    # Parsing and the array maths over years of history run off the event loop
+    report = await asyncio.to_thread(build_trends_report, rows, today, target_hours)
+    view_reports.put((user_id, "trends", target_hours), stamp, report)
+    return report
+
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Send the user's whole sleep history as a CSV file."""
+    user_id = update.effective_user.id
+    with tempfile.TemporaryFile() as file:
+        count = await write_history_csv(user_id, file)
+        if not count:
+            await update.message.reply_text("You have no sleep records to export yet.")
+            return ConversationHandler.END
+        file.seek(0)
+        await update.message.reply_document(
+            document=file,
+            filename=f"sleep_records_{datetime.now(TIMEZONE).date()}.csv",
+            caption=f"Your {count} sleep records.",
+        )
+    return ConversationHandler.END
+
+
+async def import_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text(
+        "Please send a CSV file of your sleep records, either one downloaded with "
+        "/export or with columns date, bedtime (HHMM), wake-up time (HHMM), time "
+        "to fall asleep (eg 15m), alarm time (HHMM), energy (1-5) and clarity "
+        "(1-5). Dates that already have a record are left as is."
+    )
+    return IMPORT_FILE
+
+
+async def handle_import_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    document = update.message.document
+    if document.file_size and document.file_size > MAX_IMPORT_BYTES:
+        await update.message.reply_text(
+            f"That file is too large, please send at most {MAX_IMPORT_BYTES // 1024 // 1024}MB."
+        )
+        return ConversationHandler.END
+
+    file = await document.get_file()
+    data = bytes(await file.download_as_bytearray())
+    try:
+        parsed = await asyncio.to_thread(
+            parse_history_csv, data, user_id, datetime.now(TIMEZONE).date()
+        )
+    except (UnicodeDecodeError, csv.Error):
+        await update.message.reply_text(
+            "Couldn't read that file, please send a UTF-8 CSV file."
+        )
+        return ConversationHandler.END
+
+    inserted = await sleep_records.insert_many(parsed.rows)
+    if inserted:
+        aggregates.forget(user_id)
+        sheets_mirror.add(inserted)
+    conflicting = len(parsed.rows) - len(inserted)
+
+    summary = (
+        f"Imported {len(inserted)} sleep records. "
+        f"{conflicting} dates already had a record and were left as is, "
+        f"{parsed.skipped} rows were skipped."
+    )
+    if parsed.errors:
+        summary += "\n\n" + "\n".join(parsed.errors)
+        if parsed.skipped > len(parsed.errors):
+            summary += f"\n...and {parsed.skipped - len(parsed.errors)} more"
+    await update.message.reply_text(summary)
+    return ConversationHandler.END
+
+
+async def rebuild_stats_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> int:
+    """Recompute the user's statistics from their sleep records."""
+    user_id = update.effective_user.id
+    end_date = datetime.now(TIMEZONE).date()
+    previous = aggregates.loaded(user_id)
+    rebuilt = await aggregates.rebuild(user_id)
 
-    # Query sleep records for the past 7 days
-    response = (
-        supabase.table("sleep_records")
-        .select("*")
-        .eq("user_id", user_id)
-        .gte("date", start_date.isoformat())
-        .lte("date", end_date.isoformat())
-        .order("date", desc=True)
-        .execute()
+    if previous is None:
+        result = "There were no running statistics in memory to compare against."
+    elif previous.matches(rebuilt, end_date):
+        result = "They matched the running statistics."
+    else:
+        logger.warning("Aggregates for user %s were out of sync", user_id)
+        result = "They differed from the running statistics, which have been replaced."
+    await update.message.reply_text(
+        f"Rebuilt your statistics from {rebuilt.all_time.count} sleep records. {result}"
     )
+    return ConversationHandler.END
 
-    records = response.data
 
-    if not records or all(not r["is_submitted"] for r in records):
-        await update.message.reply_text("No sleep records found for the past 7 days.")
+async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Set, turn off or show the user's daily bedtime and wake-up reminders."""
+    user_id = update.effective_user.id
+    usage = (
+        "Usage: /remind bedtime 2230, /remind wakeup 0730, "
+        "/remind bedtime off or /remind off"
+    )
+
+    if not context.args:
+        current = reminders.reminders(user_id)
+        if not current:
+            await update.message.reply_text(f"You have no reminders set.\n{usage}")
+        else:
+            lines = [
+                f"{kind.capitalize()} reminder at {at.strftime('%H%M')}"
+                for kind, at in current.items()
+            ]
+            await update.message.reply_text("\n".join(lines))
         return ConversationHandler.END
 
-    # Calculate statistics and format response
-    stats_text = "📊 *Your sleep records for the past 7 days*\n\n"
-
-    for entry in records:
-        if not entry["is_submitted"]:
-            continue
-        date = entry["date"]
-        bedtime = parse_datetime_string(entry["bed_time"])
-        sleep_time = parse_datetime_string(entry["sleep_time"])
-        alarm_time = parse_datetime_string(entry["first_alarm_time"])
-        wakeup_time = parse_datetime_string(entry["wakeup_time"])
-        energy_score = entry["energy_score"]
-        clarity_score = entry["clarity_score"]
-
-        # Calculate sleep duration if both times are available
-        duration_text = get_readable_duration(wakeup_time - sleep_time)
-
-        # Format the record
-        stats_text += f"*{date}*\n"
-        stats_text += f"🛌 Bedtime: {get_readable_time(bedtime)} (took {get_readable_duration(sleep_time - bedtime)} to fall asleep)\n"
-        stats_text += f"⏰ Wake-up time: {get_readable_time(wakeup_time)} (alarm time: {get_readable_time(alarm_time)}, snoozed for {get_readable_duration(wakeup_time-alarm_time)})\n"
-        stats_text += f"💤 Duration: {duration_text}\n"
-        stats_text += f"🔋 Energy: {'⭐' * energy_score} ({energy_score}/5)\n"
-        stats_text += f"🧠 Clarity: {'⭐' * clarity_score} ({clarity_score}/5)\n"
-
-        stats_text += "\n"
-
-    # Calculate averages if there are complete records
-    complete_records = [
-        r for r in records if r.get("sleep_time") and r.get("wakeup_time")
-    ]
-    if complete_records:
-        total_duration_seconds = 0
-        total_energy = 0
-        total_clarity = 0
-        energy_count = 0
-        clarity_count = 0
-
-        for record in complete_records:
-            sleep_time = parse_datetime_string(record.get("sleep_time"))
-            wakeup_time = parse_datetime_string(record.get("wakeup_time"))
-            duration = wakeup_time - sleep_time
-            total_duration_seconds += duration.seconds
-
-            # Sum up ratings
-            if record.get("energy_score"):
-                total_energy += record.get("energy_score")
-                energy_count += 1
-
-            if record.get("clarity_score"):
-                total_clarity += record.get("clarity_score")
-                clarity_count += 1
-
-        # Calculate average duration
-        if complete_records:
-            avg_duration_seconds = total_duration_seconds / len(complete_records)
-            avg_hours, remainder = divmod(int(avg_duration_seconds), 3600)
-            avg_minutes, _ = divmod(remainder, 60)
-            stats_text += f"*Average sleep duration: {avg_hours}h {avg_minutes}m*\n"
-
-        # Calculate average ratings
-        if energy_count:
-            avg_energy = total_energy / energy_count
-            stats_text += f"*Average energy rating: {avg_energy:.1f}/5*\n"
-
-        if clarity_count:
-            avg_clarity = total_clarity / clarity_count
-            stats_text += f"*Average clarity rating: {avg_clarity:.1f}/5*\n"
-
-    await update.message.reply_text(stats_text, parse_mode="Markdown")
+    if context.args == ["off"]:
+        for kind in (BEDTIME, WAKEUP):
+            await reminders.set_reminder(user_id, kind, None)
+        await update.message.reply_text("Turned off your reminders.")
+        return ConversationHandler.END
+
+    if len(context.args) != 2 or context.args[0] not in (BEDTIME, WAKEUP):
+        await update.message.reply_text(usage)
+        return ConversationHandler.END
+
+    kind, value = context.args
+    if value == "off":
+        await reminders.set_reminder(user_id, kind, None)
+        await update.message.reply_text(f"Turned off your {kind} reminder.")
+        return ConversationHandler.END
+
+    at = parse_24_hour_time_format(value)
+    if not at:
+        await update.message.reply_text(
+            "Invalid format. Please use 24-hour HHMM format."
+        )
+        return ConversationHandler.END
+    # Only remind when the command it asks for would be accepted
+    reminder_time = datetime.combine(datetime.now(TIMEZONE).date(), at)
+    if kind == BEDTIME and not can_record_sleep_now(reminder_time):
+        await update.message.reply_text(
+            "Bedtime reminders can only be set between 8pm and noon."
+        )
+        return ConversationHandler.END
+    if kind == WAKEUP and not can_record_wakeup_now(reminder_time):
+        await update.message.reply_text(
+            "Wake-up reminders can only be set between 3am and 8pm."
+        )
+        return ConversationHandler.END
+
+    await reminders.set_reminder(user_id, kind, at)
+    await update.message.reply_text(
+        f"I'll remind you daily at {get_readable_time(reminder_time)} "
+        f"to {'/sleep' if kind == BEDTIME else '/wakey'}."
+    )
+    return ConversationHandler.END
+
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Show or set the fraction of updates profiled, for admins only."""
+    if update.effective_user.id not in PROFILE_ADMIN_IDS:
+        await update.message.reply_text("This command is for admins only.")
+        return ConversationHandler.END
+
+    if context.args == ["flush"]:
+        written = profiler.flush()
+        await update.message.reply_text(
+            f"Wrote {written} profile reports to {profiler.path}/."
+        )
+        return ConversationHandler.END
+    if context.args:
+        value = context.args[0]
+        try:
+            rate = 0.0 if value == "off" else float(value)
+        except ValueError:
+            rate = -1.0
+        if len(context.args) != 1 or not 0 <= rate <= 1:
+            await update.message.reply_text(
+                "Usage: /profile 0.05 to profile 5% of updates, /profile off "
+                "or /profile flush"
+            )
+            return ConversationHandler.END
+        profiler.sample_rate = rate
+
+    stats = profiler.stats()
+    status = (
+        f"Profiling {stats['sample_rate']:.0%} of updates."
+        if profiler.enabled
+        else "Profiling is off."
+    )
+    await update.message.reply_text(
+        f"{status} {stats['profiled']} calls of {stats['handlers']} handlers "
+        f"profiled so far, written to {profiler.path}/ every "
+        f"{PROFILE_FLUSH_INTERVAL:.0f}s."
+    )
+    return ConversationHandler.END
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -666,10 +894,39 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
-def main() -> None:
-    """Start the bot."""
-    # Initialize the bot
-    app = ApplicationBuilder().token(TELEBOT_TOKEN).build()
+async def post_stop(app: Application) -> None:
+    """Write out what is still buffered before the bot stops."""
+    await sheets_mirror.flush()
+    profiler.flush()
+    charts.shutdown()
+
+
+def build_application(builder: ApplicationBuilder) -> Application:
+    """Build the application from `builder` and register the bot's handlers."""
+    # Outgoing requests are throttled to Telegram's flood limits, replies first
+    rate_limiter = PriorityRateLimiter()
+    app = builder.rate_limiter(rate_limiter).post_stop(post_stop).build()
+    Gauge(
+        "sleeptracker_telegram_queue_depth",
+        "Bot API requests waiting in the rate limiter queue",
+        lambda: rate_limiter.queue_depth,
+    )
+    if isinstance(app.update_processor, PerUserUpdateProcessor):
+        Gauge(
+            "sleeptracker_conversations_in_flight",
+            "Conversations with updates being handled or waiting their turn",
+            lambda: app.update_processor.active_keys,
+        )
+    Gauge(
+        "sleeptracker_record_cache_size",
+        "Sleep records held in the repository cache",
+        lambda: sleep_records.stats()["size"],
+    )
+    Gauge(
+        "sleeptracker_view_cache_hit_ratio",
+        "Share of /view reports served from the report cache",
+        lambda: view_reports.hits / max(view_reports.hits + view_reports.misses, 1),
+    )
 
     # Define conversation handlers
     conv_handler = ConversationHandler(
@@ -679,7 +936,14 @@ def main() -> None:
             CommandHandler("wakey", wakey_command),
             CommandHandler("edit", edit_command),
             CommandHandler("view", view_command),
+            CommandHandler("trends", trends_command),
+            CommandHandler("chart", chart_command),
+            CommandHandler("export", export_command),
+            CommandHandler("import", import_command),
             CommandHandler("add", add_command),
+            CommandHandler("rebuild_stats", rebuild_stats_command),
+            CommandHandler("remind", remind_command),
+            CommandHandler("profile", profile_command),
             CommandHandler("help", help_command),
         ],
         states={
@@ -708,24 +972,74 @@ def main() -> None:
             ADD_ENTRY: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, handle_add_form_input)
             ],
+            IMPORT_FILE: [MessageHandler(filters.Document.ALL, handle_import_file)],
         },
         fallbacks=[
             CommandHandler("start", start),
             CommandHandler("cancel", cancel),
         ],
         allow_reentry=True,
+        name="sleep_tracker",
+        persistent=True,
     )
 
+    # Time every handler and count the conversation states they return, and
+    # profile a sample of their calls when profiling is on
+    handlers = {"ENTRY": conv_handler.entry_points, "FALLBACK": conv_handler.fallbacks}
+    for state, state_handlers in conv_handler.states.items():
+        handlers[STATE_NAMES[state]] = state_handlers
+    for state, state_handlers in handlers.items():
+        for handler in state_handlers:
+            callback = profiler.wrap(handler.callback, state)
+            handler.callback = instrument_handler(callback, STATE_NAMES)
+
+    # Updates Telegram delivers again are dropped before they reach a handler
+    app.add_handler(TypeHandler(Update, deduplicator.check), group=-1)
     app.add_handler(conv_handler)
+    # One job sends everyone's reminders as they come due
+    app.job_queue.run_repeating(
+        reminders.tick, interval=REMINDER_TICK, first=0, name="reminders"
+    )
+    if sheets_mirror.enabled:
+        app.job_queue.run_repeating(
+            sheets_mirror.flush_job, interval=SHEETS_FLUSH_INTERVAL, name="sheets"
+        )
+    app.job_queue.run_repeating(
+        profiler.flush_job, interval=PROFILE_FLUSH_INTERVAL, name="profiles"
+    )
+    app.job_queue.run_daily(
+        weekly_digest.run,
+        time=DIGEST_TIME.replace(tzinfo=TIMEZONE),
+        days=(DIGEST_DAY,),
+        name="weekly_digest",
+    )
+    # Picks up a digest run the last shutdown interrupted, once bot_data is loaded
+    app.job_queue.run_once(
+        weekly_digest.resume, DIGEST_RESUME_DELAY, name="weekly_digest_resume"
+    )
+    return app
+
+
+def main() -> None:
+    """Start the bot."""
+    # Initialize the bot
+    persistence = SQLitePersistence(
+        PERSISTENCE_PATH, update_interval=PERSISTENCE_INTERVAL
+    )
+    app = build_application(
+        ApplicationBuilder()
+        .token(TELEBOT_TOKEN)
+        .persistence(persistence)
+        # Users are served concurrently, each user's updates still one at a time
+        .concurrent_updates(PerUserUpdateProcessor(UPDATE_CONCURRENCY))
+    )
 
-    # Start the webhook
+    # Start the webhook, with /metrics served on the same port
     if WEBHOOK_URL:
-        app.run_webhook(
-            listen="0.0.0.0",
-            port=PORT,
-            webhook_url=WEBHOOK_URL,
-            secret_token=SECRET_TOKEN,
-        )
+        # Only needed for webhooks, so polling starts without loading tornado
+        from webhook import serve_webhook
+
+        asyncio.run(serve_webhook(app, PORT, WEBHOOK_URL, SECRET_TOKEN))
     else:
         # Fallback to polling
         app.run_polling()
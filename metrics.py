@@ -0,0 +1,191 @@
+import bisect
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+# Every metric, in the order they are exposed
+REGISTRY: list["Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        # Registering a metric again replaces it, eg when the application is rebuilt
+        REGISTRY[:] = [metric for metric in REGISTRY if metric.name != name]
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple, **extra) -> str:
+        return _format_labels({**dict(zip(self.labelnames, key)), **extra})
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{self._labels(key)} {value}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Metric):
+    """A value read when metrics are collected, from a function returning it."""
+
+    type = "gauge"
+
+    def __init__(self, name, help, read: Callable[[], float]):
+        super().__init__(name, help)
+        self.read = read
+
+    def samples(self) -> list[str]:
+        try:
+            return [f"{self.name} {self.read()}"]
+        except Exception:
+            logger.exception("Failed to read gauge %s", self.name)
+            return []
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (non-cumulative, last is +Inf), sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = self._labels(key, le=bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+def render_metrics() -> str:
+    """Return every registered metric in the Prometheus text format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+HANDLER_SECONDS = Histogram(
+    "sleeptracker_handler_seconds", "Time spent in each update handler", ("handler",)
+)
+HANDLER_ERRORS = Counter(
+    "sleeptracker_handler_errors_total",
+    "Exceptions raised by update handlers",
+    ("handler", "error"),
+)
+CONVERSATION_TRANSITIONS = Counter(
+    "sleeptracker_conversation_transitions_total",
+    "Conversation states entered, by the handler that returned them",
+    ("handler", "state"),
+)
+SUPABASE_SECONDS = Histogram(
+    "sleeptracker_supabase_request_seconds",
+    "Latency of Supabase requests, including time queued for a worker thread",
+    ("table", "operation"),
+)
+SUPABASE_ERRORS = Counter(
+    "sleeptracker_supabase_errors_total",
+    "Supabase requests that raised",
+    ("table", "operation"),
+)
+TELEGRAM_SECONDS = Histogram(
+    "sleeptracker_telegram_request_seconds",
+    "Latency of Bot API requests, excluding time queued by the rate limiter",
+    ("endpoint",),
+)
+TELEGRAM_QUEUE_SECONDS = Histogram(
+    "sleeptracker_telegram_queue_seconds",
+    "Time Bot API requests waited in the rate limiter queue",
+    ("priority",),
+)
+TELEGRAM_ERRORS = Counter(
+    "sleeptracker_telegram_errors_total",
+    "Bot API requests that raised",
+    ("endpoint", "error"),
+)
+
+
+def instrument_handler(callback, state_names: dict[object, str]):
+    """Wrap a handler callback to record its latency, errors and returned state."""
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        try:
+            state = await callback(update, context)
+        except Exception as e:
+            HANDLER_ERRORS.inc(handler=name, error=type(e).__name__)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, handler=name)
+        if state is not None:
+            CONVERSATION_TRANSITIONS.inc(
+                handler=name, state=state_names.get(state, state)
+            )
+        return state
+
+    return wrapper
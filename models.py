@@ -0,0 +1,101 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+
+from parsers import parse_datetime_string
+
+
+def _parse_optional(dt_str: str | None) -> datetime | None:
+    return parse_datetime_string(dt_str) if dt_str else None
+
+
+@dataclass(frozen=True, slots=True)
+class SleepRecord:
+    """A row of `sleep_records`, with timestamps parsed into local datetimes.
+
+    Records are only complete once submitted, before that only the bedtime and
+    possibly the wake-up time are set.
+    """
+
+    user_id: int
+    date: date
+    bed_time: datetime
+    sleep_time: datetime | None = None
+    first_alarm_time: datetime | None = None
+    wakeup_time: datetime | None = None
+    energy_score: int | None = None
+    clarity_score: int | None = None
+    is_submitted: bool = False
+
+    @classmethod
+    def from_row(cls, row: dict) -> "SleepRecord":
+        return cls(
+            user_id=row["user_id"],
+            date=date.fromisoformat(row["date"]),
+            bed_time=parse_datetime_string(row["bed_time"]),
+            sleep_time=_parse_optional(row.get("sleep_time")),
+            first_alarm_time=_parse_optional(row.get("first_alarm_time")),
+            wakeup_time=_parse_optional(row.get("wakeup_time")),
+            energy_score=row.get("energy_score"),
+            clarity_score=row.get("clarity_score"),
+            is_submitted=bool(row.get("is_submitted")),
+        )
+
+    @property
+    def fall_asleep(self) -> timedelta | None:
+        if self.sleep_time is None:
+            return None
+        return self.sleep_time - self.bed_time
+
+    @property
+    def duration(self) -> timedelta | None:
+        if self.sleep_time is None or self.wakeup_time is None:
+            return None
+        return self.wakeup_time - self.sleep_time
+
+
+@dataclass(slots=True)
+class SleepForm:
+    """The wake-up form a user is filling in, kept in `context.user_data["form"]`."""
+
+    sleep_date: date
+    bedtime: datetime
+    fall_asleep: timedelta
+    alarm: datetime
+    wakeup: datetime
+    energy: int = 3
+    clarity: int = 3
+    # Whether the form adds a record through /add rather than completing one
+    is_new: bool = False
+    # Field the user was last asked to send a new value for
+    edit_field: str | None = None
+    # Message showing the form and the form text it currently shows, without the
+    # edit notice, so edits update it in place and are skipped when nothing changed
+    message_id: int | None = None
+    text: str | None = None
+
+    @classmethod
+    def from_record(cls, record: SleepRecord) -> "SleepForm":
+        """Prefill the form with a submitted record, for /edit."""
+        return cls(
+            sleep_date=record.date,
+            bedtime=record.bed_time,
+            fall_asleep=record.fall_asleep,
+            alarm=record.first_alarm_time,
+            wakeup=record.wakeup_time,
+            energy=record.energy_score,
+            clarity=record.clarity_score,
+        )
+
+    def to_row(self, user_id: int) -> dict:
+        """Serialize the form as a submitted `sleep_records` row."""
+        return {
+            "user_id": user_id,
+            "date": self.sleep_date.isoformat(),
+            "bed_time": self.bedtime.isoformat(),
+            "sleep_time": (self.bedtime + self.fall_asleep).isoformat(),
+            "first_alarm_time": self.alarm.isoformat(),
+            "wakeup_time": self.wakeup.isoformat(),
+            "energy_score": self.energy,
+            "clarity_score": self.clarity,
+            "is_submitted": True,
+        }
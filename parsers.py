@@ -1,10 +1,13 @@
 import re
-from datetime import datetime, timedelta
-
-from dateutil import parser
+from datetime import date, datetime, timedelta
+from typing import Iterable
+from zoneinfo import ZoneInfo
 
 from date_utils import TIMEZONE
 
+# Same zone as TIMEZONE, zoneinfo just converts timestamps into it much faster
+_LOCAL_TZINFO = ZoneInfo(TIMEZONE.zone)
+
 
 def parse_24_hour_time_format(input: str) -> datetime | None:
     try:
@@ -22,6 +25,16 @@ def parse_day_month_format(input: str) -> datetime | None:
         return None
 
 
+def parse_date(input: str) -> date | None:
+    """Parse a full date, as YYYY-MM-DD or DD/MM/YYYY."""
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(input, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
 def parse_duration(input: str) -> timedelta | None:
     try:
         pattern = re.compile(r"(?:(\d+(?:\.\d+)?)h)?\s*(?:(\d+)m)?", re.IGNORECASE)
@@ -37,4 +50,24 @@ def parse_duration(input: str) -> timedelta | None:
 
 
 def parse_datetime_string(dt_str: str) -> datetime:
-    return parser.isoparse(dt_str).astimezone(TIMEZONE)
+    try:
+        dt = datetime.fromisoformat(dt_str)
+    except ValueError:
+        # Before Python 3.11 fromisoformat rejects some shapes Supabase can return,
+        # eg fractional seconds with trailing zeros trimmed
+        from dateutil import parser
+
+        dt = parser.isoparse(dt_str)
+    return dt.astimezone(_LOCAL_TZINFO)
+
+
+def parse_datetime_strings(dt_strs: Iterable[str]) -> list[datetime]:
+    """Decode a column of timestamps, parsing repeated values only once."""
+    decoded = {}
+    result = []
+    for dt_str in dt_strs:
+        dt = decoded.get(dt_str)
+        if dt is None:
+            dt = decoded[dt_str] = parse_datetime_string(dt_str)
+        result.append(dt)
+    return result
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data BLOB);
+CREATE TABLE IF NOT EXISTS bot_data (id INTEGER PRIMARY KEY CHECK (id = 0), data BLOB);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT, key TEXT, state BLOB, PRIMARY KEY (name, key)
+);
+"""
+
+
+class SQLitePersistence(BasePersistence):
+    """Persists user_data, bot_data and conversation states to a local SQLite file.
+
+    The application hands over changed entries every `update_interval` seconds.
+    They are buffered here and written in a single transaction, so a burst of
+    updates costs one write rather than one per update. A batch that fails to
+    write is kept and retried with the next one.
+    """
+
+    def __init__(self, path: str, update_interval: float = 60):
+        super().__init__(
+            store_data=PersistenceInput(chat_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        # Entries changed since the last flush, None marks a deletion
+        self._dirty_user_data: dict[int, dict | None] = {}
+        self._dirty_bot_data: dict | None = None
+        self._dirty_conversations: dict[tuple[str, str], object] = {}
+        self._flush_task: asyncio.Task | None = None
+        # bot_data is handed over on every run even when unchanged
+        self._bot_data_blob: bytes | None = None
+
+    async def get_user_data(self) -> dict[int, dict]:
+        rows = self._conn.execute("SELECT user_id, data FROM user_data").fetchall()
+        return {user_id: pickle.loads(data) for user_id, data in rows}
+
+    async def get_chat_data(self) -> dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        row = self._conn.execute("SELECT data FROM bot_data WHERE id = 0").fetchone()
+        self._bot_data_blob = row[0] if row else None
+        return pickle.loads(row[0]) if row else {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        rows = self._conn.execute(
+            "SELECT key, state FROM conversations WHERE name = ?", (name,)
+        ).fetchall()
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        self._dirty_conversations[(name, json.dumps(key))] = new_state
+        self._schedule_flush()
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._dirty_user_data[user_id] = data
+        self._schedule_flush()
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        self._dirty_bot_data = data
+        self._schedule_flush()
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._dirty_user_data[user_id] = None
+        self._schedule_flush()
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Write all pending changes, called by the application on shutdown."""
+        if self._flush_task:
+            await self._flush_task
+        try:
+            self._write(*self._pickle(*self._take_pending()))
+        except Exception:
+            logger.exception("Failed to write persistence data to %s", self.path)
+        self._conn.close()
+
+    def _schedule_flush(self):
+        # All update_* calls of one persistence run are gathered together, so a
+        # single task started by the first of them picks up the whole batch
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(
+                self._flush_soon()
+            )
+
+    async def _flush_soon(self):
+        await asyncio.sleep(0)
+        pending = self._take_pending()
+        try:
+            # Pickled here on the event loop, between handlers changing the same
+            # objects, so the thread only ever sees bytes
+            blobs = self._pickle(*pending)
+            await asyncio.to_thread(self._write, *blobs)
+        except Exception:
+            logger.exception("Failed to write persistence data to %s", self.path)
+            self._restore(*pending)
+
+    def _take_pending(self) -> tuple[dict, dict | None, dict]:
+        pending = (
+            self._dirty_user_data,
+            self._dirty_bot_data,
+            self._dirty_conversations,
+        )
+        self._dirty_user_data, self._dirty_bot_data = {}, None
+        self._dirty_conversations = {}
+        return pending
+
+    def _restore(self, user_data: dict, bot_data: dict | None, conversations: dict):
+        """Put back a batch that failed to write, beneath any newer changes."""
+        self._dirty_user_data = {**user_data, **self._dirty_user_data}
+        if self._dirty_bot_data is None:
+            self._dirty_bot_data = bot_data
+        self._dirty_conversations = {**conversations, **self._dirty_conversations}
+
+    @staticmethod
+    def _pickle(
+        user_data: dict, bot_data: dict | None, conversations: dict
+    ) -> tuple[dict, bytes | None, dict]:
+        """Pickle a batch, keeping None for deletions."""
+        return (
+            {
+                user_id: None if data is None else pickle.dumps(data)
+                for user_id, data in user_data.items()
+            },
+            None if bot_data is None else pickle.dumps(bot_data),
+            {
+                key: None if state is None else pickle.dumps(state)
+                for key, state in conversations.items()
+            },
+        )
+
+    def _write(self, user_data: dict, bot_data: bytes | None, conversations: dict):
+        if bot_data == self._bot_data_blob:
+            bot_data = None
+        if not (user_data or bot_data or conversations):
+            return
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)",
+                [
+                    (user_id, data)
+                    for user_id, data in user_data.items()
+                    if data is not None
+                ],
+            )
+            self._conn.executemany(
+                "DELETE FROM user_data WHERE user_id = ?",
+                [(user_id,) for user_id, data in user_data.items() if data is None],
+            )
+            if bot_data:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO bot_data (id, data) VALUES (0, ?)",
+                    (bot_data,),
+                )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO conversations (name, key, state) "
+                "VALUES (?, ?, ?)",
+                [
+                    (name, key, state)
+                    for (name, key), state in conversations.items()
+                    if state is not None
+                ],
+            )
+            self._conn.executemany(
+                "DELETE FROM conversations WHERE name = ? AND key = ?",
+                [key for key, state in conversations.items() if state is None],
+            )
+        if bot_data:
+            self._bot_data_blob = bot_data
@@ -0,0 +1,125 @@
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import random
+import re
+
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+# Fraction of updates profiled, 0 turns profiling off. Admins can change it with
+# /profile while the bot runs
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+# Directory the aggregated reports are written to
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+# Seconds between writes of the reports
+PROFILE_FLUSH_INTERVAL = float(os.environ.get("PROFILE_FLUSH_INTERVAL", "300"))
+# Comma separated Telegram user ids allowed to use /profile
+PROFILE_ADMIN_IDS = {
+    int(user_id)
+    for user_id in os.environ.get("PROFILE_ADMIN_IDS", "").split(",")
+    if user_id.strip()
+}
+# Functions listed in each text report
+PROFILE_REPORT_LINES = 40
+
+
+class HandlerProfiler:
+    """Profiles a sample of handler calls with cProfile, aggregated per handler.
+
+    Stats are summed per handler and the conversation state it handles, and
+    written to PROFILE_DIR as `<state>.<handler>.prof`, which pstats and snakeviz
+    read, with a text summary next to it. Only one call is profiled at a time, as
+    cProfile can't nest. While a handler awaits, the profile also includes other
+    tasks run by the event loop, like sending queued requests.
+    """
+
+    def __init__(self, sample_rate: float = PROFILE_SAMPLE_RATE, path=PROFILE_DIR):
+        self.sample_rate = sample_rate
+        self.path = path
+        self._stats: dict[tuple[str, str], pstats.Stats] = {}
+        self._calls: dict[tuple[str, str], int] = {}
+        self._dirty: set[tuple[str, str]] = set()
+        self._active = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def wrap(self, callback, state: str):
+        """Return `callback` profiled when sampled, as handling `state`."""
+        key = (state, callback.__name__)
+
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            # All that's paid per update while profiling is off
+            if (
+                not self.sample_rate
+                or self._active
+                or random.random() >= self.sample_rate
+            ):
+                return await callback(update, context)
+            self._active = True
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return await callback(update, context)
+            finally:
+                profile.disable()
+                self._active = False
+                self._add(key, profile)
+
+        return wrapper
+
+    def _add(self, key: tuple[str, str], profile: cProfile.Profile):
+        if key in self._stats:
+            self._stats[key].add(profile)
+        else:
+            self._stats[key] = pstats.Stats(profile)
+        self._calls[key] = self._calls.get(key, 0) + 1
+        self._dirty.add(key)
+
+    def report(self, key: tuple[str, str]) -> str:
+        """Return the text summary of a handler's aggregated profile."""
+        text = io.StringIO()
+        stats = self._stats[key]
+        stats.stream = text
+        print(f"{self._calls[key]} profiled calls of {key[1]} in {key[0]}", file=text)
+        stats.sort_stats("cumulative").print_stats(PROFILE_REPORT_LINES)
+        return text.getvalue()
+
+    def flush(self) -> int:
+        """Write the reports of handlers profiled since the last flush."""
+        if not self._dirty:
+            return 0
+        os.makedirs(self.path, exist_ok=True)
+        written = 0
+        for key in sorted(self._dirty):
+            name = re.sub(r"[^\w.-]", "_", ".".join(key))
+            try:
+                self._stats[key].dump_stats(os.path.join(self.path, f"{name}.prof"))
+                with open(os.path.join(self.path, f"{name}.txt"), "w") as f:
+                    f.write(self.report(key))
+            except OSError:
+                logger.exception("Failed to write the profile of %s", key)
+                continue
+            written += 1
+        self._dirty.clear()
+        return written
+
+    async def flush_job(self, context: ContextTypes.DEFAULT_TYPE):
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "profiled": sum(self._calls.values()),
+            "handlers": len(self._stats),
+        }
+
+
+profiler = HandlerProfiler()
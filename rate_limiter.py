@@ -0,0 +1,245 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import TELEGRAM_ERRORS, TELEGRAM_QUEUE_SECONDS, TELEGRAM_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Request priorities, lower goes first. Pass rate_limit_args={"priority": BACKGROUND}
+# for messages the bot sends on its own, such as reminders
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Telegram's flood limits: about 30 messages per second overall, 20 per minute in a
+# group, and around one per second in a private chat with short bursts allowed
+GLOBAL_RATE = float(os.environ.get("TELEGRAM_GLOBAL_RATE", "30"))
+GROUP_CHAT_RATE = float(os.environ.get("TELEGRAM_GROUP_CHAT_RATE", "20")) / 60
+PRIVATE_CHAT_RATE = float(os.environ.get("TELEGRAM_PRIVATE_CHAT_RATE", "1"))
+PRIVATE_CHAT_BURST = int(os.environ.get("TELEGRAM_PRIVATE_CHAT_BURST", "5"))
+# Times a request is retried after Telegram answers with RetryAfter
+MAX_RETRIES = int(os.environ.get("TELEGRAM_MAX_RETRIES", "3"))
+# Idle per-chat buckets are dropped once there are more than this many
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, and bursts of `capacity`."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available, 0 if one is available now."""
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class PriorityRateLimiter(BaseRateLimiter[dict]):
+    """Throttles outgoing Bot API requests to stay within Telegram's flood limits.
+
+    Requests wait in a single queue ordered by priority and arrival, and are let
+    through as the global and per-chat token buckets allow, so replies to users
+    overtake background traffic. A RetryAfter pauses every request for as long as
+    Telegram asks before the request is queued again.
+    """
+
+    def __init__(
+        self,
+        global_rate=GLOBAL_RATE,
+        group_chat_rate=GROUP_CHAT_RATE,
+        private_chat_rate=PRIVATE_CHAT_RATE,
+        private_chat_burst=PRIVATE_CHAT_BURST,
+        max_retries=MAX_RETRIES,
+    ):
+        self.global_rate = global_rate
+        self.group_chat_rate = group_chat_rate
+        self.private_chat_rate = private_chat_rate
+        self.private_chat_burst = private_chat_burst
+        self.max_retries = max_retries
+        self._global: TokenBucket | None = None
+        self._chats: dict[int | str, TokenBucket] = {}
+        self._paused_until = 0.0
+        # (priority, sequence, chat_id, future) of requests waiting for a slot
+        self._queue: list[tuple[int, int, int | str | None, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: asyncio.Task | None = None
+        # Counters for stats()
+        self.sent = 0
+        self.retries = 0
+        self.delayed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for *_, future in self._queue:
+            future.cancel()
+        self._queue.clear()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> dict:
+        by_priority = {}
+        for priority, *_ in self._queue:
+            by_priority[priority] = by_priority.get(priority, 0) + 1
+        return {
+            "queued": len(self._queue),
+            "queued_by_priority": by_priority,
+            "sent": self.sent,
+            "delayed": self.delayed,
+            "retries": self.retries,
+            "avg_wait": self.total_wait / self.sent if self.sent else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+    async def process_request(
+        self, callback, args, kwargs, endpoint, data, rate_limit_args
+    ):
+        priority = (rate_limit_args or {}).get("priority", INTERACTIVE)
+        chat_id = data.get("chat_id")
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        await self._acquire(priority, chat_id)
+        waited = loop.time() - queued_at
+        self.sent += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        TELEGRAM_QUEUE_SECONDS.observe(
+            waited, priority="interactive" if priority == INTERACTIVE else "background"
+        )
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                with TELEGRAM_SECONDS.time(endpoint=endpoint):
+                    return await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                TELEGRAM_ERRORS.inc(endpoint=endpoint, error="RetryAfter")
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                retry_after = float(exc.retry_after)
+                logger.warning(
+                    "Flood limit hit on %s, pausing requests for %ss",
+                    endpoint,
+                    retry_after,
+                )
+                self._paused_until = max(self._paused_until, loop.time() + retry_after)
+                await self._acquire(priority, chat_id)
+            except Exception as e:
+                TELEGRAM_ERRORS.inc(endpoint=endpoint, error=type(e).__name__)
+                raise
+
+    def _chat_bucket(self, chat_id, now: float) -> TokenBucket | None:
+        if chat_id is None:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._chats = {
+                    key: b for key, b in self._chats.items() if not b.is_full(now)
+                }
+            # Group chats have negative ids, channels may be given by @username
+            if isinstance(chat_id, str) or chat_id < 0:
+                bucket = TokenBucket(self.group_chat_rate, 1, now)
+            else:
+                bucket = TokenBucket(
+                    self.private_chat_rate, self.private_chat_burst, now
+                )
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _delay(self, chat_id, now: float) -> float:
+        """Seconds until a request to chat_id could go out, ignoring the queue."""
+        if self._global is None:
+            self._global = TokenBucket(self.global_rate, self.global_rate, now)
+        delay = max(self._paused_until - now, self._global.delay(now))
+        bucket = self._chat_bucket(chat_id, now)
+        if bucket is not None:
+            delay = max(delay, bucket.delay(now))
+        return delay
+
+    def _take(self, chat_id, now: float):
+        self._global.take(now)
+        bucket = self._chat_bucket(chat_id, now)
+        if bucket is not None:
+            bucket.take(now)
+
+    async def _acquire(self, priority: int, chat_id):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if not self._queue and self._delay(chat_id, now) == 0:
+            self._take(chat_id, now)
+            return
+
+        self.delayed += 1
+        future = loop.create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), chat_id, future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+        await future
+
+    async def _dispatch(self):
+        """Let queued requests through in priority order as the buckets refill."""
+        loop = asyncio.get_running_loop()
+        while self._queue:
+            now = loop.time()
+            # Requests whose chat is still rate limited make way for later ones
+            skipped = []
+            wait = None
+            while self._queue:
+                entry = heapq.heappop(self._queue)
+                chat_id, future = entry[2], entry[3]
+                if future.done():
+                    continue
+                delay = self._delay(chat_id, now)
+                if delay == 0:
+                    self._take(chat_id, now)
+                    future.set_result(None)
+                    continue
+                skipped.append(entry)
+                wait = delay if wait is None else min(wait, delay)
+                if self._global.delay(now) > 0 or self._paused_until > now:
+                    # Nothing else can go out before then either
+                    break
+            for entry in skipped:
+                heapq.heappush(self._queue, entry)
+            if not self._queue:
+                break
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,196 @@
+import asyncio
+import heapq
+import logging
+import os
+from datetime import datetime, time, timedelta
+
+from telegram import Bot
+from telegram.error import Forbidden, TelegramError
+from telegram.ext import ContextTypes
+
+from database import execute, get_client
+from date_utils import TIMEZONE, get_sleep_date
+from rate_limiter import BACKGROUND
+from repository import sleep_records
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for due reminders
+REMINDER_TICK = float(os.environ.get("REMINDER_TICK", "60"))
+# Users per request when loading reminder settings at startup
+USERS_PAGE_SIZE = 1000
+
+BEDTIME = "bedtime"
+WAKEUP = "wakeup"
+REMINDER_TEXT = {
+    BEDTIME: "🌙 Time to wind down! Send /sleep when you get into bed.",
+    WAKEUP: "🌅 Good morning! Send /wakey to log how you slept.",
+}
+
+
+def next_occurrence(at: time, now: datetime) -> datetime:
+    """Return the first local datetime after now at time of day `at`."""
+    due = TIMEZONE.localize(datetime.combine(now.date(), at))
+    if due <= now:
+        due = TIMEZONE.localize(datetime.combine(now.date() + timedelta(days=1), at))
+    return due
+
+
+class ReminderScheduler:
+    """Sends each user's bedtime and wake-up reminders at the times they chose.
+
+    Upcoming reminders sit in a single heap ordered by due time, drained by one
+    repeating job, so a tick costs O(log n) per due reminder however many users
+    are registered. Users who already logged the night are skipped, looked up
+    with one batched query per tick.
+    """
+
+    def __init__(self):
+        # (due timestamp, user_id, kind, version) of upcoming reminders
+        self._heap: list[tuple[float, int, str, int]] = []
+        # (user_id, kind) -> (time of day, version). Heap entries with an older
+        # version were replaced or cancelled and are dropped when they come due
+        self._settings: dict[tuple[int, str], tuple[time, int]] = {}
+        self._version = 0
+        self._loaded = False
+        self.sent = 0
+        self.skipped = 0
+
+    def stats(self) -> dict:
+        return {
+            "scheduled": len(self._settings),
+            "heap": len(self._heap),
+            "sent": self.sent,
+            "skipped": self.skipped,
+        }
+
+    def reminders(self, user_id: int) -> dict[str, time]:
+        """Return the reminder times a user has set, by kind."""
+        return {
+            kind: self._settings[(user_id, kind)][0]
+            for kind in (BEDTIME, WAKEUP)
+            if (user_id, kind) in self._settings
+        }
+
+    def schedule(
+        self, user_id: int, kind: str, at: time | None, now: datetime | None = None
+    ):
+        """Remind the user daily at `at` from now on, or never if at is None."""
+        if at is None:
+            self._settings.pop((user_id, kind), None)
+            return
+        self._version += 1
+        self._settings[(user_id, kind)] = (at, self._version)
+        due = next_occurrence(at, now or datetime.now(TIMEZONE))
+        heapq.heappush(self._heap, (due.timestamp(), user_id, kind, self._version))
+
+    async def set_reminder(self, user_id: int, kind: str, at: time | None):
+        """Save a user's reminder time, None to turn the reminder off."""
+        await execute(
+            get_client()
+            .table("users")
+            .upsert({"id": user_id, f"{kind}_reminder": at.isoformat() if at else None})
+        )
+        self.schedule(user_id, kind, at)
+
+    async def load(self):
+        """Schedule the reminders saved in `users`, paging through users by id."""
+        now = datetime.now(TIMEZONE)
+        last_id = None
+        while True:
+            query = (
+                get_client()
+                .table("users")
+                .select("id,bedtime_reminder,wakeup_reminder")
+                .or_("bedtime_reminder.not.is.null,wakeup_reminder.not.is.null")
+            )
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            response = await execute(query.order("id").limit(USERS_PAGE_SIZE))
+            for row in response.data:
+                for kind in (BEDTIME, WAKEUP):
+                    if row[f"{kind}_reminder"]:
+                        at = time.fromisoformat(row[f"{kind}_reminder"])
+                        self.schedule(row["id"], kind, at, now)
+            if len(response.data) < USERS_PAGE_SIZE:
+                break
+            last_id = response.data[-1]["id"]
+        self._loaded = True
+        logger.info("Loaded %d reminders", len(self._settings))
+
+    def _pop_due(self, now: datetime) -> list[tuple[int, str]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now.timestamp():
+            _, user_id, kind, version = heapq.heappop(self._heap)
+            setting = self._settings.get((user_id, kind))
+            if setting is None or setting[1] != version:
+                continue
+            due.append((user_id, kind))
+            # Reminders due while the bot was down are not caught up on
+            self.schedule(user_id, kind, setting[0], now)
+        return due
+
+    async def tick(self, context: ContextTypes.DEFAULT_TYPE):
+        """Send the reminders that have come due, run by the job queue."""
+        if not self._loaded:
+            await self.load()
+        now = datetime.now(TIMEZONE)
+        due = self._pop_due(now)
+        if not due:
+            return
+
+        try:
+            records = await sleep_records.get_many(
+                list({user_id for user_id, _ in due}), get_sleep_date(now)
+            )
+        except Exception:
+            # These reminders are already rescheduled for tomorrow, so send them
+            # all rather than skip them for the day
+            logger.exception("Failed to look up records for due reminders")
+            records = {}
+        reminders = []
+        for user_id, kind in due:
+            record = records.get(user_id)
+            if kind == BEDTIME:
+                logged = record is not None
+            else:
+                logged = record is not None and (
+                    record.wakeup_time is not None or record.is_submitted
+                )
+            if logged:
+                self.skipped += 1
+            else:
+                reminders.append((user_id, kind))
+        # Sending is paced by the rate limiter, don't hold up the next tick
+        context.application.create_task(self._send_all(context.bot, reminders))
+
+    async def _send_all(self, bot: Bot, reminders: list[tuple[int, str]]):
+        await asyncio.gather(
+            *(self._send(bot, user_id, kind) for user_id, kind in reminders)
+        )
+
+    async def _send(self, bot: Bot, user_id: int, kind: str):
+        try:
+            await bot.send_message(
+                chat_id=user_id,
+                text=REMINDER_TEXT[kind],
+                rate_limit_args={"priority": BACKGROUND},
+            )
+            self.sent += 1
+        except Forbidden:
+            # The user blocked the bot
+            logger.info("Turning off reminders for user %s", user_id)
+            await execute(
+                get_client()
+                .table("users")
+                .upsert(
+                    {"id": user_id, "bedtime_reminder": None, "wakeup_reminder": None}
+                )
+            )
+            self.schedule(user_id, BEDTIME, None)
+            self.schedule(user_id, WAKEUP, None)
+        except TelegramError as e:
+            logger.warning("Failed to send %s reminder to %s: %s", kind, user_id, e)
+
+
+reminders = ReminderScheduler()
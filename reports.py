@@ -0,0 +1,210 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from date_utils import (
+    TIMEZONE,
+    get_readable_date,
+    get_readable_duration,
+    get_readable_time,
+)
+from models import SleepForm, SleepRecord
+from stats import TRENDS_WINDOWS, SleepColumns, Summary, Trends
+
+# Number of most recent records listed in full in a /view report, the rest of the
+# window only contributes to the averages
+VIEW_DETAIL_RECORDS = 7
+# Bounds for the cache of rendered /view reports
+VIEW_CACHE_SIZE = int(os.environ.get("VIEW_CACHE_SIZE", "1000"))
+VIEW_CACHE_TTL = float(os.environ.get("VIEW_CACHE_TTL", "600"))
+
+
+def _local_time(epoch: int) -> datetime:
+    return datetime.fromtimestamp(int(epoch), TIMEZONE)
+
+
+def _readable_seconds(seconds) -> str:
+    return get_readable_duration(timedelta(seconds=int(seconds)))
+
+
+def render_sleep_form(form: SleepForm, notice: str | None = None) -> str:
+    """Build the text of the wake-up form, shown above its edit buttons.
+
+    `notice` confirms the last edit, above the form it applies to.
+    """
+    return (
+        (f"✅ {notice}\n\n" if notice else "")
+        + f"🛌 **{'New ' if form.is_new else ''}Sleep Record for {get_readable_date(form.sleep_date)}**\n\n"
+        f"- 🛏️ Bedtime: {get_readable_time(form.bedtime)}\n"
+        f"- ⏱️ Time to fall asleep: {get_readable_duration(form.fall_asleep)}\n"
+        f"- ⏰ First alarm: {get_readable_time(form.alarm)}\n"
+        f"- 🌅 Wake-up time: {get_readable_time(form.wakeup)}\n"
+        f"- ⚡ Energy score: {form.energy}\n"
+        f"- 🧠 Clarity score: {form.clarity}\n\n"
+        "🔽 *Tap to edit:*"
+    )
+
+
+def render_view_report(latest: SleepColumns, summary: Summary, days: int) -> str:
+    """Build the /view message for the past `days` days.
+
+    `latest` holds the records listed in full and `summary` covers the whole window.
+    """
+    stats_text = f"📊 *Your sleep records for the past {days} days*\n\n"
+
+    if len(latest) < summary.count:
+        stats_text += (
+            f"_Showing the latest {len(latest)} of {summary.count} records_\n\n"
+        )
+    latency, snooze, duration = latest.sleep_latency, latest.snooze, latest.duration
+    for i in range(len(latest)):
+        bed_time = _local_time(latest.bed_time[i])
+        alarm_time = _local_time(latest.alarm_time[i])
+        wakeup_time = _local_time(latest.wakeup_time[i])
+        energy, clarity = int(latest.energy[i]), int(latest.clarity[i])
+
+        stats_text += f"*{latest.dates[i]}*\n"
+        stats_text += f"🛌 Bedtime: {get_readable_time(bed_time)} (took {_readable_seconds(latency[i])} to fall asleep)\n"
+        stats_text += f"⏰ Wake-up time: {get_readable_time(wakeup_time)} (alarm time: {get_readable_time(alarm_time)}, snoozed for {_readable_seconds(snooze[i])})\n"
+        stats_text += f"💤 Duration: {_readable_seconds(duration[i])}\n"
+        stats_text += f"🔋 Energy: {'⭐' * energy} ({energy}/5)\n"
+        stats_text += f"🧠 Clarity: {'⭐' * clarity} ({clarity}/5)\n"
+        stats_text += "\n"
+
+    if summary:
+        avg_hours, remainder = divmod(int(summary.avg_duration), 3600)
+        avg_minutes, _ = divmod(remainder, 60)
+        stats_text += f"*Average sleep duration: {avg_hours}h {avg_minutes}m*\n"
+        stats_text += f"*Average energy rating: {summary.avg_energy:.1f}/5*\n"
+        stats_text += f"*Average clarity rating: {summary.avg_clarity:.1f}/5*\n"
+
+    return stats_text
+
+
+def _readable_debt(seconds: float) -> str:
+    if abs(seconds) < 60:
+        return "none"
+    amount = _readable_seconds(abs(seconds))
+    return amount if seconds > 0 else f"{amount} ahead"
+
+
+def _readable_correlation(value: float | None) -> str:
+    if value is None:
+        return "n/a"
+    strength = (
+        "weak" if abs(value) < 0.3 else "moderate" if abs(value) < 0.6 else "strong"
+    )
+    return f"{value:+.2f} ({strength})"
+
+
+def render_trends_report(trends: Trends, target_hours: float) -> str:
+    """Build the /trends message."""
+    short, long = TRENDS_WINDOWS
+    text = (
+        f"📈 *Your sleep trends over {trends.nights} nights "
+        f"since {trends.first_date}*\n\n"
+    )
+
+    text += "*Average sleep duration*\n"
+    for days, mean in ((short, trends.mean_short), (long, trends.mean_long)):
+        value = _readable_seconds(mean) if mean is not None else "no records"
+        text += f"- Past {days} days: {value}\n"
+    if trends.mean_long is not None and trends.mean_long_before is not None:
+        change = trends.mean_long - trends.mean_long_before
+        direction = "up" if change >= 0 else "down"
+        text += (
+            f"- {direction.capitalize()} {_readable_seconds(abs(change))} "
+            f"on the {long} days before\n"
+        )
+
+    text += f"\n*Sleep debt against {target_hours:g} hours a night*\n"
+    text += f"- Past {short} days: {_readable_debt(trends.debt_short)}\n"
+    text += f"- Past {long} days: {_readable_debt(trends.debt_long)}\n"
+    text += f"- All time: {_readable_debt(trends.debt_total)}\n"
+
+    text += f"\n*Consistency over the past {long} days (standard deviation)*\n"
+    for label, std in (("Bedtime", trends.bedtime_std), ("Wake-up", trends.wakeup_std)):
+        value = f"±{_readable_seconds(std)}" if std is not None else "n/a"
+        text += f"- {label}: {value}\n"
+
+    text += "\n*How your scores follow your sleep (correlation)*\n"
+    for (score, measure), value in trends.correlations.items():
+        text += (
+            f"- {score.capitalize()} with {measure}: "
+            f"{_readable_correlation(value)}\n"
+        )
+    return text
+
+
+def render_weekly_digest(
+    records: list[SleepRecord], summary: Summary | None, start, end
+) -> str:
+    """Build the weekly digest for the submitted records from start to end."""
+    text = (
+        f"🗓️ *Your week of sleep, {get_readable_date(start)} "
+        f"to {get_readable_date(end)}*\n\n"
+    )
+    if not summary:
+        return text + (
+            "You didn't log any nights this week. Send /sleep when you go to bed "
+            "and /wakey when you get up to start tracking."
+        )
+
+    for record in records:
+        text += (
+            f"- {record.date.strftime('%a')} {get_readable_date(record.date)}: "
+            f"{get_readable_duration(record.duration)}, "
+            f"🔋 {record.energy_score}/5, 🧠 {record.clarity_score}/5\n"
+        )
+    text += f"\n*{summary.count} of 7 nights logged*\n"
+    text += f"*Average sleep duration: {_readable_seconds(summary.avg_duration)}*\n"
+    text += f"*Average energy rating: {summary.avg_energy:.1f}/5*\n"
+    text += f"*Average clarity rating: {summary.avg_clarity:.1f}/5*\n"
+    return text + "\nSee /trends for how this compares to the longer run."
+
+
+class ReportCache:
+    """Rendered reports, reused until what they were rendered from changes.
+
+    Each report is stored under its key, eg (user_id, days), with a stamp of its
+    inputs, eg the end date and the user's record version. A lookup with a
+    different stamp misses, so a write makes the user's reports stale without
+    having to find them.
+    """
+
+    def __init__(self, max_size=VIEW_CACHE_SIZE, ttl=VIEW_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # key -> (expiry, stamp, report or None), least recently used first
+        self._cache: OrderedDict[tuple, tuple[float, tuple, str | None]] = OrderedDict()
+
+    def get(self, key: tuple, stamp: tuple) -> tuple[bool, str | None]:
+        """Return whether a report for `stamp` is cached, and the report."""
+        entry = self._cache.get(key)
+        if entry is None or entry[0] < time.monotonic() or entry[1] != stamp:
+            self._cache.pop(key, None)
+            self.misses += 1
+            return False, None
+        self._cache.move_to_end(key)
+        self.hits += 1
+        return True, entry[2]
+
+    def put(self, key: tuple, stamp: tuple, report: str | None):
+        self._cache[key] = (time.monotonic() + self.ttl, stamp, report)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+view_reports = ReportCache()
+# Paths of rendered /chart images, stamped the same way
+chart_paths = ReportCache()
@@ -0,0 +1,303 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import AsyncIterator
+
+from database import execute, get_client
+from models import SleepRecord
+
+# Bounds for the cache of recently read or written sleep records
+RECORD_CACHE_SIZE = int(os.environ.get("RECORD_CACHE_SIZE", "10000"))
+RECORD_CACHE_TTL = float(os.environ.get("RECORD_CACHE_TTL", "600"))
+# Rows per request when reading a user's whole history, at most PostgREST's max-rows
+HISTORY_PAGE_SIZE = 1000
+# Users per request when looking up many users' records, keeps the URL short
+USER_BATCH_SIZE = 500
+# Rows per request when inserting many records
+INSERT_BATCH_SIZE = 500
+
+
+def _date_key(d: date | datetime) -> date:
+    return d.date() if isinstance(d, datetime) else d
+
+
+class SleepRecordRepository:
+    """Reads and writes `sleep_records`, keeping recently used records in memory.
+
+    Every write goes through this class, so cached rows are updated as they are
+    written and lookups of a (user_id, date) seen recently don't hit Supabase.
+    Missing records are cached as well, as None.
+    """
+
+    def __init__(self, max_size=RECORD_CACHE_SIZE, ttl=RECORD_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # (user_id, date) -> (expiry, record or None), least recently used first
+        self._cache: OrderedDict[
+            tuple[int, date], tuple[float, SleepRecord | None]
+        ] = OrderedDict()
+        # user_id -> count of writes to their records, one entry per user who wrote
+        self._versions: dict[int, int] = {}
+
+    def version(self, user_id: int) -> int:
+        """Return a number that changes whenever the user's records are written."""
+        return self._versions.get(user_id, 0)
+
+    def _bump(self, user_id: int):
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    async def _write(self, user_ids, query):
+        """Execute a write to the users' records, bumping their versions around it.
+
+        The bump after the write means a report read while it was in flight is not
+        kept under the version it was stamped with.
+        """
+        for user_id in user_ids:
+            self._bump(user_id)
+        try:
+            return await execute(query)
+        finally:
+            for user_id in user_ids:
+                self._bump(user_id)
+
+    def _lookup(
+        self, user_id: int, sleep_date: date
+    ) -> tuple[bool, SleepRecord | None]:
+        key = (user_id, _date_key(sleep_date))
+        entry = self._cache.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._cache.pop(key, None)
+            self.misses += 1
+            return False, None
+        self._cache.move_to_end(key)
+        self.hits += 1
+        return True, entry[1]
+
+    def _peek(self, user_id: int, sleep_date: date) -> tuple[bool, SleepRecord | None]:
+        """Like _lookup, without counting a hit or miss or reordering the cache."""
+        entry = self._cache.get((user_id, _date_key(sleep_date)))
+        if entry is None or entry[0] < time.monotonic():
+            return False, None
+        return True, entry[1]
+
+    def _store(self, user_id: int, sleep_date: date, record: SleepRecord | None):
+        key = (user_id, _date_key(sleep_date))
+        self._cache[key] = (time.monotonic() + self.ttl, record)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def _invalidate(self, user_id: int, sleep_date: date):
+        self._cache.pop((user_id, _date_key(sleep_date)), None)
+
+    def stats(self) -> dict:
+        return {"size": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+    async def get(self, user_id: int, sleep_date: date) -> SleepRecord | None:
+        """Return the record for the given sleep date, or None if there is none."""
+        found, record = self._lookup(user_id, sleep_date)
+        if found:
+            return record
+        response = await execute(
+            get_client()
+            .table("sleep_records")
+            .select("*")
+            .eq("user_id", user_id)
+            .eq("date", _date_key(sleep_date).isoformat())
+        )
+        record = SleepRecord.from_row(response.data[0]) if response.data else None
+        self._store(user_id, sleep_date, record)
+        return record
+
+    async def get_many(
+        self, user_ids: list[int], sleep_date: date
+    ) -> dict[int, SleepRecord | None]:
+        """Return the records of many users for one sleep date, by user id.
+
+        Users are looked up in batches of USER_BATCH_SIZE per request. Results are
+        not cached, and cached records are only peeked at, so bulk lookups neither
+        evict the records of active users nor skew the hit rate.
+        """
+        records = {}
+        missing = []
+        for user_id in user_ids:
+            found, record = self._peek(user_id, sleep_date)
+            if found:
+                records[user_id] = record
+            else:
+                missing.append(user_id)
+        for i in range(0, len(missing), USER_BATCH_SIZE):
+            batch = missing[i : i + USER_BATCH_SIZE]
+            response = await execute(
+                get_client()
+                .table("sleep_records")
+                .select("*")
+                .eq("date", _date_key(sleep_date).isoformat())
+                .in_("user_id", batch)
+            )
+            rows = {row["user_id"]: row for row in response.data}
+            for user_id in batch:
+                row = rows.get(user_id)
+                records[user_id] = SleepRecord.from_row(row) if row else None
+        return records
+
+    async def list_range(
+        self, user_id: int, start: date, end: date, limit: int | None = None
+    ) -> list[SleepRecord]:
+        """Return records with dates between start and end inclusive, latest first."""
+        query = (
+            get_client()
+            .table("sleep_records")
+            .select("*")
+            .eq("user_id", user_id)
+            .gte("date", start.isoformat())
+            .lte("date", end.isoformat())
+            .order("date", desc=True)
+        )
+        if limit is not None:
+            query = query.limit(limit)
+        response = await execute(query)
+        records = [SleepRecord.from_row(row) for row in response.data]
+        for record in records:
+            self._store(user_id, record.date, record)
+        return records
+
+    async def iter_history(
+        self, user_id: int, page_size: int = HISTORY_PAGE_SIZE
+    ) -> AsyncIterator[list[SleepRecord]]:
+        """Yield all submitted records of a user in pages, oldest first."""
+        async for rows in self.iter_history_rows(user_id, page_size=page_size):
+            yield [SleepRecord.from_row(row) for row in rows]
+
+    async def iter_history_rows(
+        self, user_id: int, columns: str = "*", page_size: int = HISTORY_PAGE_SIZE
+    ) -> AsyncIterator[list[dict]]:
+        """Like iter_history, but yields raw rows with only the given columns.
+
+        Pages are fetched by date rather than offset so each one is an index range
+        scan however long the history is. `columns` must include date.
+        """
+        last_date = None
+        while True:
+            query = (
+                get_client()
+                .table("sleep_records")
+                .select(columns)
+                .eq("user_id", user_id)
+                .eq("is_submitted", True)
+            )
+            if last_date is not None:
+                query = query.gt("date", last_date)
+            response = await execute(query.order("date").limit(page_size))
+            if response.data:
+                yield response.data
+            if len(response.data) < page_size:
+                return
+            last_date = response.data[-1]["date"]
+
+    async def record_bedtime(
+        self, user_id: int, sleep_date: date, bed_time: datetime
+    ) -> SleepRecord | None:
+        """Create a record with the given bedtime.
+
+        Returns the new record, or None if one already exists for that date.
+        """
+        found, record = self._lookup(user_id, sleep_date)
+        if found and record is not None:
+            return None
+        # Insert and existence check in one round trip, conflicting rows are left as
+        # is and not returned
+        response = await self._write(
+            [user_id],
+            get_client()
+            .table("sleep_records")
+            .upsert(
+                {
+                    "user_id": user_id,
+                    "date": _date_key(sleep_date).isoformat(),
+                    "bed_time": bed_time.isoformat(),
+                },
+                on_conflict="user_id,date",
+                ignore_duplicates=True,
+            ),
+        )
+        if not response.data:
+            self._invalidate(user_id, sleep_date)
+            return None
+        record = SleepRecord.from_row(response.data[0])
+        self._store(user_id, sleep_date, record)
+        return record
+
+    async def record_wakeup(
+        self,
+        user_id: int,
+        sleep_date: date,
+        default_bed_time: datetime,
+        wakeup_time: datetime,
+    ) -> SleepRecord | None:
+        """Set the wake-up time, creating the record with default_bed_time if needed.
+
+        Returns the written record, or None if the record was already submitted.
+        """
+        found, record = self._lookup(user_id, sleep_date)
+        if found and record is not None and record.is_submitted:
+            return None
+        # Single round trip upsert, see sql/record_wakeup.sql
+        response = await self._write(
+            [user_id],
+            get_client().rpc(
+                "record_wakeup",
+                {
+                    "p_user_id": user_id,
+                    "p_date": _date_key(sleep_date).isoformat(),
+                    "p_bed_time": default_bed_time.isoformat(),
+                    "p_wakeup_time": wakeup_time.isoformat(),
+                },
+            ),
+        )
+        if not response.data:
+            self._invalidate(user_id, sleep_date)
+            return None
+        record = SleepRecord.from_row(response.data[0])
+        self._store(user_id, sleep_date, record)
+        return record
+
+    async def upsert(self, row: dict) -> SleepRecord | None:
+        """Insert or replace a full record, eg one built by SleepForm.to_row."""
+        response = await self._write(
+            [row["user_id"]], get_client().table("sleep_records").upsert(row)
+        )
+        if not response.data:
+            self._invalidate(row["user_id"], date.fromisoformat(row["date"]))
+            return None
+        record = SleepRecord.from_row(response.data[0])
+        self._store(record.user_id, record.date, record)
+        return record
+
+    async def insert_many(
+        self, rows: list[dict], batch_size: int = INSERT_BATCH_SIZE
+    ) -> list[SleepRecord]:
+        """Insert full records in batches, leaving existing records for a date as is.
+
+        Returns the records that were inserted.
+        """
+        inserted = []
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i : i + batch_size]
+            response = await self._write(
+                {row["user_id"] for row in batch},
+                get_client()
+                .table("sleep_records")
+                .upsert(batch, on_conflict="user_id,date", ignore_duplicates=True),
+            )
+            for row in response.data:
+                record = SleepRecord.from_row(row)
+                self._store(record.user_id, record.date, record)
+                inserted.append(record)
+        return inserted
+
+
+sleep_records = SleepRecordRepository()
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+
+from telegram.ext import ContextTypes
+
+from models import SleepRecord
+
+logger = logging.getLogger(__name__)
+
+# Same settings as the old Google Sheet integration in archive/gsheets.py. The
+# mirror is off unless SPREADSHEET_ID is set
+SERVICE_ACCOUNT_FILE = os.environ.get("SERVICE_ACCOUNT_FILE")
+SCOPES = os.environ.get("SCOPES", "https://www.googleapis.com/auth/spreadsheets")
+SPREADSHEET_ID = os.environ.get("SPREADSHEET_ID")
+SHEET_NAME = os.environ.get("SHEET_NAME", "sleepdata")
+# Seconds between writes of buffered rows to the sheet
+SHEETS_FLUSH_INTERVAL = float(os.environ.get("SHEETS_FLUSH_INTERVAL", "60"))
+# Rows kept while the sheet can't be written to, the oldest are dropped beyond this
+SHEETS_MAX_BUFFER = int(os.environ.get("SHEETS_MAX_BUFFER", "50000"))
+
+
+def sheet_row(record: SleepRecord) -> list:
+    """Lay out a record as columns A-G of the sheet, which /import reads back.
+
+    The first four columns are those of the old sheet, followed by the alarm time
+    and the energy and clarity scores, so every recorded field is kept.
+    """
+    minutes = int(record.fall_asleep.total_seconds() // 60)
+    alarm = record.first_alarm_time
+    return [
+        record.date.isoformat(),
+        record.bed_time.strftime("%H%M"),
+        record.wakeup_time.strftime("%H%M"),
+        f"{minutes}m",
+        alarm.strftime("%H%M") if alarm else "",
+        record.energy_score,
+        record.clarity_score,
+    ]
+
+
+class SheetsMirror:
+    """Appends submitted sleep records to a Google Sheet in the background.
+
+    Records are buffered in memory and written every SHEETS_FLUSH_INTERVAL seconds
+    with a single append call, which adds rows after the last row of the table, so
+    no row counter has to be kept in the sheet. The sheet is an append-only log,
+    an edited record appears again as a new row.
+    """
+
+    def __init__(
+        self, spreadsheet_id=SPREADSHEET_ID, values=None, max_buffer=SHEETS_MAX_BUFFER
+    ):
+        self.spreadsheet_id = spreadsheet_id
+        self.max_buffer = max_buffer
+        # spreadsheets().values() resource, built on first use unless given
+        self._values = values
+        self._buffer: list[list] = []
+        self._lock = asyncio.Lock()
+        self.appended = 0
+        self.dropped = 0
+        self.requests = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.spreadsheet_id)
+
+    def add(self, records: list[SleepRecord]):
+        """Queue submitted records to be written with the next flush."""
+        if not self.enabled:
+            return
+        self._buffer.extend(sheet_row(record) for record in records)
+        self._trim()
+
+    def _trim(self):
+        if len(self._buffer) > self.max_buffer:
+            dropped = len(self._buffer) - self.max_buffer
+            logger.warning("Sheets mirror is behind, dropping %d rows", dropped)
+            del self._buffer[:dropped]
+            self.dropped += dropped
+
+    def _get_values(self):
+        if self._values is None:
+            from google.oauth2 import service_account
+            from googleapiclient.discovery import build
+
+            credentials = service_account.Credentials.from_service_account_file(
+                SERVICE_ACCOUNT_FILE, scopes=SCOPES.split(",")
+            )
+            self._values = (
+                build("sheets", "v4", credentials=credentials, cache_discovery=False)
+                .spreadsheets()
+                .values()
+            )
+        return self._values
+
+    def _append(self, rows: list[list]):
+        self._get_values().append(
+            spreadsheetId=self.spreadsheet_id,
+            range=f"{SHEET_NAME}!A:G",
+            valueInputOption="RAW",
+            insertDataOption="INSERT_ROWS",
+            body={"values": rows},
+        ).execute()
+
+    async def flush(self):
+        """Write all buffered rows in one request, keeping them if it fails."""
+        async with self._lock:
+            if not self._buffer:
+                return
+            rows, self._buffer = self._buffer, []
+            try:
+                self.requests += 1
+                await asyncio.to_thread(self._append, rows)
+            except Exception:
+                logger.exception("Failed to append %d rows to the sheet", len(rows))
+                # Retried with the next flush, ahead of rows added since
+                self._buffer[:0] = rows
+                self._trim()
+                return
+            self.appended += len(rows)
+
+    async def flush_job(self, context: ContextTypes.DEFAULT_TYPE):
+        await self.flush()
+
+
+sheets_mirror = SheetsMirror()
@@ -0,0 +1,20 @@
+-- Records a wake-up time for (p_user_id, p_date) in a single round trip.
+-- Inserts a new record with p_bed_time as the bedtime if none exists, otherwise
+-- updates the wake-up time of the existing record unless it is already submitted.
+-- Returns the written record, or no rows if the record was already submitted.
+create or replace function record_wakeup(
+  p_user_id bigint,
+  p_date date,
+  p_bed_time timestamptz,
+  p_wakeup_time timestamptz
+)
+returns setof sleep_records
+language sql
+as $$
+  insert into sleep_records (user_id, date, bed_time, wakeup_time)
+  values (p_user_id, p_date, p_bed_time, p_wakeup_time)
+  on conflict (user_id, date) do update
+    set wakeup_time = excluded.wakeup_time
+    where sleep_records.is_submitted is not true
+  returning *;
+$$;
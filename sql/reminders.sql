@@ -0,0 +1,12 @@
+-- Daily reminder times set with /remind, null when the reminder is off.
+alter table users
+  add column if not exists bedtime_reminder time,
+  add column if not exists wakeup_reminder time;
+
+-- Reminders are loaded at startup by paging through the users who have any set.
+create index if not exists users_reminders_idx on users (id)
+  where bedtime_reminder is not null or wakeup_reminder is not null;
+
+-- The reminder job looks up many users' records for one date at a time.
+create index if not exists sleep_records_date_user_id_idx
+  on sleep_records (date, user_id);
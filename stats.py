@@ -0,0 +1,229 @@
+import os
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Iterable
+
+import numpy as np
+
+from models import SleepRecord
+from parsers import parse_datetime_strings
+
+# Hours of sleep a night that /trends counts sleep debt against, by default
+SLEEP_TARGET_HOURS = float(os.environ.get("SLEEP_TARGET_HOURS", "8"))
+# Days in the short and long rolling windows of /trends
+TRENDS_WINDOWS = (7, 28)
+# Columns of `sleep_records` that SleepColumns.from_rows reads
+ROW_COLUMNS = (
+    "date,bed_time,sleep_time,first_alarm_time,wakeup_time,energy_score,clarity_score"
+)
+
+
+def _timestamps(values: list[datetime]) -> np.ndarray:
+    return np.array([value.timestamp() for value in values], dtype=np.int64)
+
+
+def _epoch_seconds(values: list[str]) -> np.ndarray:
+    # Supabase returns timestamps in UTC, which NumPy can parse as a whole column
+    if all(value.endswith("+00:00") for value in values):
+        try:
+            return (
+                np.array([value[:-6] for value in values], dtype="datetime64[us]")
+                .astype("datetime64[s]")
+                .astype(np.int64)
+            )
+        except ValueError:
+            pass
+    return np.array(
+        [dt.timestamp() for dt in parse_datetime_strings(values)], dtype=np.int64
+    )
+
+
+@dataclass(frozen=True)
+class SleepColumns:
+    """Submitted sleep records stored column-wise, latest first.
+
+    Times are epoch seconds so durations and averages are plain array arithmetic.
+    """
+
+    dates: np.ndarray  # datetime64[D]
+    bed_time: np.ndarray  # int64 epoch seconds
+    sleep_time: np.ndarray
+    alarm_time: np.ndarray
+    wakeup_time: np.ndarray
+    energy: np.ndarray  # int8 scores from 1 to 5
+    clarity: np.ndarray
+
+    @classmethod
+    def from_records(cls, records: Iterable[SleepRecord]) -> "SleepColumns":
+        """Build columns from parsed records, skipping unsubmitted ones."""
+        records = sorted(
+            (r for r in records if r.is_submitted), key=lambda r: r.date, reverse=True
+        )
+        return cls(
+            dates=np.array([r.date for r in records], dtype="datetime64[D]"),
+            bed_time=_timestamps([r.bed_time for r in records]),
+            sleep_time=_timestamps([r.sleep_time for r in records]),
+            alarm_time=_timestamps([r.first_alarm_time for r in records]),
+            wakeup_time=_timestamps([r.wakeup_time for r in records]),
+            energy=np.array([r.energy_score for r in records], dtype=np.int8),
+            clarity=np.array([r.clarity_score for r in records], dtype=np.int8),
+        )
+
+    @classmethod
+    def from_rows(cls, rows: list[dict]) -> "SleepColumns":
+        """Build columns straight from submitted `sleep_records` rows.
+
+        Skips building a SleepRecord per row, for loading long histories.
+        """
+        rows = sorted(rows, key=lambda r: r["date"], reverse=True)
+        return cls(
+            dates=np.array([r["date"] for r in rows], dtype="datetime64[D]"),
+            bed_time=_epoch_seconds([r["bed_time"] for r in rows]),
+            sleep_time=_epoch_seconds([r["sleep_time"] for r in rows]),
+            alarm_time=_epoch_seconds([r["first_alarm_time"] for r in rows]),
+            wakeup_time=_epoch_seconds([r["wakeup_time"] for r in rows]),
+            energy=np.array([r["energy_score"] for r in rows], dtype=np.int8),
+            clarity=np.array([r["clarity_score"] for r in rows], dtype=np.int8),
+        )
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def head(self, n: int) -> "SleepColumns":
+        """Return the n latest records."""
+        return SleepColumns(
+            *(getattr(self, name)[:n] for name in self.__dataclass_fields__)
+        )
+
+    @property
+    def duration(self) -> np.ndarray:
+        """Seconds asleep."""
+        return self.wakeup_time - self.sleep_time
+
+    @property
+    def sleep_latency(self) -> np.ndarray:
+        """Seconds taken to fall asleep after going to bed."""
+        return self.sleep_time - self.bed_time
+
+    @property
+    def snooze(self) -> np.ndarray:
+        """Seconds between the first alarm and waking up."""
+        return self.wakeup_time - self.alarm_time
+
+
+@dataclass(frozen=True)
+class Summary:
+    count: int
+    avg_duration: float  # seconds
+    avg_energy: float
+    avg_clarity: float
+
+
+def summarize(columns: SleepColumns) -> Summary | None:
+    if not len(columns):
+        return None
+    return Summary(
+        count=len(columns),
+        avg_duration=float(columns.duration.mean()),
+        avg_energy=float(columns.energy.mean()),
+        avg_clarity=float(columns.clarity.mean()),
+    )
+
+
+@dataclass(frozen=True)
+class Trends:
+    """Statistics over a user's whole history, times in seconds."""
+
+    nights: int
+    first_date: date
+    # Mean duration over the nights in the last 7 and 28 days, and the 28 before
+    mean_short: float | None
+    mean_long: float | None
+    mean_long_before: float | None
+    # Target minus duration, summed over the same windows and the whole history
+    debt_short: float
+    debt_long: float
+    debt_total: float
+    # Circular standard deviation of the time of day, over the last 28 days
+    bedtime_std: float | None
+    wakeup_std: float | None
+    # (score, measure) -> Pearson correlation over the whole history
+    correlations: dict[tuple[str, str], float | None]
+
+
+def _window_means(days: np.ndarray, values: np.ndarray, n_days: int, window: int):
+    """Mean of the values in the `window` days ending on each day, NaN if none."""
+    # Totals per day, records after the last day are left out
+    sums = np.concatenate(([0], np.cumsum(np.bincount(days, values, n_days)[:n_days])))
+    counts = np.concatenate(([0], np.cumsum(np.bincount(days, None, n_days)[:n_days])))
+    start = np.maximum(np.arange(1, n_days + 1) - window, 0)
+    total, count = sums[1:] - sums[start], counts[1:] - counts[start]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return total / count
+
+
+def _time_of_day_std(epochs: np.ndarray) -> float | None:
+    """Circular standard deviation of the time of day, in seconds.
+
+    Times are taken as angles on a 24 hour clock, so 23:50 and 00:10 are as close
+    as 11:50 and 12:10 whatever time of day they fall around.
+    """
+    if len(epochs) < 2:
+        return None
+    angles = (epochs % 86400) * (2 * np.pi / 86400)
+    length = min(float(np.abs(np.exp(1j * angles).mean())), 1.0)
+    return float(np.sqrt(-2 * np.log(length)) * 86400 / (2 * np.pi))
+
+
+def _correlation(x: np.ndarray, y: np.ndarray) -> float | None:
+    if len(x) < 3 or not x.std() or not y.std():
+        return None
+    return float(np.corrcoef(x, y)[0, 1])
+
+
+def compute_trends(
+    columns: SleepColumns, today: date, target_hours: float = SLEEP_TARGET_HOURS
+) -> Trends | None:
+    """Compute the /trends statistics with array operations over every record."""
+    if not len(columns):
+        return None
+    short, long = TRENDS_WINDOWS
+    first = columns.dates.min()
+    # Day number of each record, and of today, counting from the first record
+    days = (columns.dates - first).astype(np.int64)
+    n_days = int((np.datetime64(today, "D") - first).astype(np.int64)) + 1
+    duration = columns.duration.astype(np.float64)
+
+    means = {
+        window: _window_means(days, duration, n_days, window)
+        for window in TRENDS_WINDOWS
+    }
+
+    def mean_at(window: int, day: int) -> float | None:
+        value = means[window][day] if day >= 0 else np.nan
+        return None if np.isnan(value) else float(value)
+
+    debt = target_hours * 3600 - duration
+    age = n_days - 1 - days
+    recent = age < long
+    measures = {"duration": duration, "snooze": columns.snooze.astype(np.float64)}
+    scores = {"energy": columns.energy, "clarity": columns.clarity}
+    return Trends(
+        nights=len(columns),
+        first_date=first.astype(date),
+        mean_short=mean_at(short, n_days - 1),
+        mean_long=mean_at(long, n_days - 1),
+        mean_long_before=mean_at(long, n_days - 1 - long),
+        debt_short=float(debt[age < short].sum()),
+        debt_long=float(debt[recent].sum()),
+        debt_total=float(debt.sum()),
+        bedtime_std=_time_of_day_std(columns.bed_time[recent]),
+        wakeup_std=_time_of_day_std(columns.wakeup_time[recent]),
+        correlations={
+            (score, measure): _correlation(
+                scores[score].astype(np.float64), measures[measure]
+            )
+            for score in scores
+            for measure in measures
+        },
+    )
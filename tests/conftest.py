@@ -0,0 +1,32 @@
+import os
+import sys
+import time
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def morning(monkeypatch):
+    """Run the bot's clock from 7am today, when /wakey is allowed."""
+    import main
+    from benchmarks.load_test import MorningClock
+    from date_utils import TIMEZONE
+
+    monkeypatch.setattr(MorningClock, "start", datetime.now(TIMEZONE).replace(hour=7))
+    monkeypatch.setattr(MorningClock, "offset", time.monotonic())
+    monkeypatch.setattr(main, "datetime", MorningClock)
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    """Start every test without records or reports cached by an earlier one."""
+    from reports import chart_paths, view_reports
+    from repository import sleep_records
+
+    yield
+    sleep_records._cache.clear()
+    view_reports.clear()
+    chart_paths.clear()
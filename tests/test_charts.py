@@ -0,0 +1,64 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import main
+from benchmarks.fake_supabase import FakeSupabase, install, load_history, make_history
+from charts import ChartRenderer
+from date_utils import TIMEZONE
+from reports import chart_paths
+
+USERS = range(1, 4)
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    client = FakeSupabase()
+    install(client)
+    today = datetime.now(TIMEZONE).date()
+    for user_id in USERS:
+        load_history(client, make_history(user_id, 30, today))
+    renderer = ChartRenderer(path=str(tmp_path / "charts"), workers=1)
+    monkeypatch.setattr(main, "charts", renderer)
+    yield client
+    renderer.shutdown()
+
+
+async def _charts(days: int = 30) -> list[str | None]:
+    return await asyncio.gather(*(main.get_chart(user_id, days) for user_id in USERS))
+
+
+def test_repeated_charts_are_cached(client):
+    async def run():
+        first = await _charts()
+        requests = client.requests
+        second = await _charts()
+        return first, second, client.requests - requests
+
+    first, second, requests = asyncio.run(run())
+    assert all(first)
+    assert second == first
+    # Cached charts are sent without asking Supabase again
+    assert requests == 0
+    assert main.charts.rendered == len(USERS)
+
+
+def test_charts_on_disk_are_reused_after_a_restart(client):
+    async def run():
+        first = await _charts()
+        # As after a restart, when only the files on disk remain
+        chart_paths.clear()
+        second = await _charts()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert second == first
+    # A chart is drawn again only when its data changed
+    assert main.charts.rendered == len(USERS)
+    assert main.charts.reused == len(USERS)
+
+
+def test_no_chart_without_records(client):
+    assert asyncio.run(main.get_chart(max(USERS) + 1, 30)) is None
+    assert main.charts.rendered == 0
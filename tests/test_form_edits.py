@@ -0,0 +1,50 @@
+import asyncio
+
+from telegram.ext import ApplicationBuilder
+
+import main
+from benchmarks.fake_supabase import FakeSupabase, install
+from benchmarks.fake_telegram import FakeBotRequest, callback_update, message_update
+from benchmarks.load_test import LoadTest
+from persistence import SQLitePersistence
+
+
+async def _edit_calls(tmp_path, edits: list[tuple[str, str]]) -> list[int]:
+    """Open a form, then make each edit, returning editMessageText calls per edit."""
+    install(FakeSupabase())
+    bot_request = FakeBotRequest()
+    app = main.build_application(
+        ApplicationBuilder()
+        .token("123456:test")
+        .request(bot_request)
+        .get_updates_request(FakeBotRequest())
+        .updater(None)
+        .persistence(SQLitePersistence(str(tmp_path / "test.sqlite")))
+    )
+    app.bot.rate_limiter.private_chat_rate = 1000
+    load_test = LoadTest(app, bot_request)
+    calls = []
+    async with app:
+        await app.start()
+        for text in ("/sleep", "/wakey"):
+            await load_test.send(message_update(app.bot, 1, text))
+        for button, value in edits:
+            before = bot_request.calls["editMessageText"]
+            await load_test.send(callback_update(app.bot, 1, button))
+            await load_test.send(message_update(app.bot, 1, value))
+            calls.append(bot_request.calls["editMessageText"] - before)
+        await app.stop()
+    assert load_test.errors == 0
+    return calls
+
+
+def test_form_is_only_edited_when_a_value_changes(tmp_path, morning):
+    edits = [
+        ("edit_energy", "3"),
+        ("edit_energy", "4"),
+        ("edit_energy", "4"),
+        ("edit_clarity", "2"),
+    ]
+    calls = asyncio.run(_edit_calls(tmp_path, edits))
+    # The form opens with energy and clarity at 3
+    assert calls == [0, 1, 0, 1]
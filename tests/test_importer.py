@@ -0,0 +1,30 @@
+from datetime import date
+
+from importer import parse_history_csv
+
+TODAY = date(2026, 10, 17)
+
+
+def test_sheet_rows_keep_their_alarm_and_scores():
+    data = b"2026-10-15,2330,0715,20m,0700,4,2\n"
+    parsed = parse_history_csv(data, 1, TODAY)
+    assert parsed.skipped == 0, parsed.errors
+    (row,) = parsed.rows
+    assert row["bed_time"].startswith("2026-10-14T23:30")
+    assert row["first_alarm_time"].startswith("2026-10-15T07:00")
+    assert row["wakeup_time"].startswith("2026-10-15T07:15")
+    assert (row["energy_score"], row["clarity_score"]) == (4, 2)
+
+
+def test_rows_without_alarm_or_scores_are_skipped():
+    data = (
+        b"2026-10-13,2330,0715,20m\n"
+        b"2026-10-14,2330,0715,20m,0700,,\n"
+        b"2026-10-15,2330,0715,20m,0700,6,2\n"
+        b"2026-10-16,2330,0715,20m,0700,3,3\n"
+    )
+    parsed = parse_history_csv(data, 1, TODAY)
+    assert [row["date"] for row in parsed.rows] == ["2026-10-16"]
+    assert parsed.skipped == 3
+    assert parsed.errors[0] == "Row 1: missing the alarm time, energy or clarity score"
+    assert parsed.errors[2] == "Row 3: score '6' is not between 1 and 5"
@@ -0,0 +1,100 @@
+import asyncio
+import csv
+import io
+import logging
+from datetime import date
+
+import pytest
+
+from benchmarks.fake_sheets import FakeValues
+from benchmarks.fake_supabase import make_history
+from importer import parse_history_csv
+from models import SleepRecord
+from sheets import SheetsMirror, sheet_row
+
+
+@pytest.fixture
+def records() -> list[SleepRecord]:
+    return [
+        SleepRecord.from_row(row) for row in reversed(make_history(1, 60, date.today()))
+    ]
+
+
+async def _mirror(records: list[SleepRecord], values: FakeValues, per_flush: int):
+    mirror = SheetsMirror("test", values=values)
+    for i in range(0, len(records), per_flush):
+        mirror.add(records[i : i + per_flush])
+        await mirror.flush()
+    return mirror
+
+
+def test_rows_are_appended_in_one_request_per_flush(records):
+    values = FakeValues()
+    mirror = asyncio.run(_mirror(records, values, 20))
+    assert values.rows[1:] == [sheet_row(record) for record in records]
+    assert values.requests == 3
+    assert mirror.appended == len(records)
+
+
+def test_rows_keep_every_recorded_field(records):
+    record = records[0]
+    assert sheet_row(record)[4:] == [
+        record.first_alarm_time.strftime("%H%M"),
+        record.energy_score,
+        record.clarity_score,
+    ]
+
+
+def test_rows_read_back_through_import(records):
+    values = FakeValues()
+    asyncio.run(_mirror(records, values, 20))
+    text = io.StringIO()
+    csv.writer(text).writerows(values.rows[1:])
+    parsed = parse_history_csv(text.getvalue().encode(), 1, date.today())
+    assert parsed.skipped == 0, parsed.errors
+    for row, record in zip(parsed.rows, records, strict=True):
+        imported = SleepRecord.from_row(row)
+        assert imported.date == record.date
+        for name in ("bed_time", "sleep_time", "first_alarm_time", "wakeup_time"):
+            # The sheet keeps times to the minute
+            expected = getattr(record, name).replace(second=0, microsecond=0)
+            assert getattr(imported, name) == expected, name
+        assert imported.energy_score == record.energy_score
+        assert imported.clarity_score == record.clarity_score
+
+
+def test_rows_are_kept_across_a_failed_flush(records, caplog):
+    values = FakeValues()
+    values.fail_next = 1
+    mirror = SheetsMirror("test", values=values)
+
+    async def run():
+        mirror.add(records[:10])
+        with caplog.at_level(logging.CRITICAL, logger="sheets"):
+            await mirror.flush()
+        assert mirror.appended == 0 and len(values.rows) == 1
+        mirror.add(records[10:20])
+        await mirror.flush()
+
+    asyncio.run(run())
+    assert values.rows[1:] == [sheet_row(record) for record in records[:20]]
+
+
+def test_buffer_stays_bounded_while_the_sheet_is_down(records, caplog):
+    values = FakeValues()
+    values.fail_next = 5
+    mirror = SheetsMirror("test", values=values, max_buffer=25)
+
+    async def run():
+        with caplog.at_level(logging.CRITICAL, logger="sheets"):
+            for i in range(0, 50, 10):
+                mirror.add(records[i : i + 10])
+                await mirror.flush()
+                assert len(mirror._buffer) <= 25
+        mirror.add(records[50:60])
+        await mirror.flush()
+
+    asyncio.run(run())
+    # The oldest rows are dropped, the newest kept in order
+    assert mirror.dropped == 35
+    assert values.rows[1:] == [sheet_row(record) for record in records[35:]]
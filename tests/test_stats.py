@@ -0,0 +1,43 @@
+import statistics
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from benchmarks.fake_supabase import make_history
+from benchmarks.suite import HISTORY_SIZES, python_trends
+from date_utils import TIMEZONE
+from stats import SleepColumns, compute_trends
+
+
+@pytest.mark.parametrize("records", HISTORY_SIZES)
+def test_trends_match_a_plain_loop(records):
+    today = datetime.now(TIMEZONE).date()
+    rows = make_history(1, records, today)
+    trends = compute_trends(SleepColumns.from_rows(rows), today, 8)
+    for name, expected in python_trends(rows, today, 8).items():
+        actual = getattr(trends, name)
+        if expected is None:
+            assert actual is None, name
+        else:
+            assert actual == pytest.approx(expected, rel=1e-6, abs=1e-6), name
+
+
+def test_time_of_day_spread_wraps_around_midnight():
+    """Bedtimes around midnight and wake-ups around noon must show a small spread."""
+    today = datetime.now(TIMEZONE).date()
+    rows = make_history(1, 20, today)
+    deviations = []
+    for i, row in enumerate(rows):
+        day = date.fromisoformat(row["date"])
+        # Local 23:50 to 00:10 bedtimes and 11:50 to 12:10 wake-ups, 16:00 and 04:00 UTC
+        minutes = (i % 5) * 5 - 10
+        deviations.append(minutes * 60)
+        midnight = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+        bed_time = midnight - timedelta(hours=8, minutes=-minutes)
+        wakeup_time = midnight + timedelta(hours=4, minutes=minutes)
+        row["bed_time"] = bed_time.isoformat()
+        row["wakeup_time"] = wakeup_time.isoformat()
+    expected = statistics.pstdev(deviations)
+    trends = compute_trends(SleepColumns.from_rows(rows), today, 8)
+    assert trends.bedtime_std == pytest.approx(expected, rel=0.01)
+    assert trends.wakeup_std == pytest.approx(expected, rel=0.01)
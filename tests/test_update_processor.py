@@ -0,0 +1,116 @@
+import asyncio
+
+from telegram.ext import ApplicationBuilder
+
+import main
+from benchmarks.fake_supabase import FakeSupabase, install
+from benchmarks.fake_telegram import FakeBotRequest, callback_update, message_update
+from benchmarks.load_test import LoadTest
+from persistence import SQLitePersistence
+from update_processor import PerUserUpdateProcessor
+
+# Form updates sent back to back, without waiting for the bot's replies
+FORM_FLOW = [
+    ("message", "/sleep"),
+    ("message", "/wakey"),
+    ("callback", "edit_energy"),
+    ("message", "4"),
+    ("callback", "edit_clarity"),
+    ("message", "2"),
+]
+
+
+async def _blocked(release: asyncio.Event, order: list, name: str):
+    await release.wait()
+    order.append(name)
+
+
+def test_burst_does_not_hold_up_other_users(monkeypatch):
+    monkeypatch.setattr("update_processor.update_key", lambda update: update)
+
+    async def run():
+        processor = PerUserUpdateProcessor(2)
+        release = asyncio.Event()
+        order = []
+        # One user's burst, twice the limit, all queued behind its first update
+        burst = [
+            asyncio.create_task(
+                processor.process_update(("a", "a"), _blocked(release, order, i))
+            )
+            for i in range(4)
+        ]
+        await asyncio.sleep(0)
+        assert processor.current_concurrent_updates == 1
+
+        done = asyncio.Event()
+        done.set()
+        await asyncio.wait_for(
+            processor.process_update(("b", "b"), _blocked(done, order, "b")), 1
+        )
+        release.set()
+        await asyncio.gather(*burst)
+        assert order == ["b", 0, 1, 2, 3]
+        assert processor.active_keys == 0
+
+    asyncio.run(run())
+
+
+async def _run_flows(tmp_path, users: int, flow: list) -> tuple:
+    client = FakeSupabase()
+    install(client)
+    bot_request = FakeBotRequest(latency=0.005)
+    app = main.build_application(
+        ApplicationBuilder()
+        .token("123456:test")
+        .request(bot_request)
+        .get_updates_request(FakeBotRequest())
+        .updater(None)
+        .persistence(SQLitePersistence(str(tmp_path / "test.sqlite")))
+        .concurrent_updates(PerUserUpdateProcessor(4))
+    )
+    # Telegram's flood limits would only slow the test down
+    app.bot.rate_limiter.global_rate = 1000
+    app.bot.rate_limiter.private_chat_rate = 1000
+    load_test = LoadTest(app, bot_request)
+    async with app:
+        await app.start()
+        tasks = []
+        for user_id in range(1, users + 1):
+            for kind, payload in flow:
+                if kind == "message":
+                    update = message_update(app.bot, user_id, payload)
+                else:
+                    update = callback_update(app.bot, user_id, payload)
+                tasks.append(asyncio.create_task(load_test.send(update)))
+                await asyncio.sleep(0)
+        await asyncio.wait_for(asyncio.gather(*tasks), 30)
+        await app.stop()
+    assert load_test.errors == 0
+    # Read back what was saved on shutdown
+    saved = SQLitePersistence(str(tmp_path / "test.sqlite"))
+    return (
+        client,
+        await saved.get_user_data(),
+        await saved.get_conversations("sleep_tracker"),
+    )
+
+
+def test_interleaved_form_updates_end_in_order(tmp_path, morning):
+    users = 20
+    _, user_data, conversations = asyncio.run(_run_flows(tmp_path, users, FORM_FLOW))
+    for user_id in range(1, users + 1):
+        form = user_data[user_id]["form"]
+        assert (form.energy, form.clarity) == (4, 2)
+        assert conversations[(user_id, user_id)] == main.WAKEUP_FORM
+
+
+def test_interleaved_submissions_are_saved(tmp_path, morning):
+    users = 20
+    flow = FORM_FLOW + [("callback", "submit_form")]
+    client, _, conversations = asyncio.run(_run_flows(tmp_path, users, flow))
+    records = {row["user_id"]: row for row in client.tables["sleep_records"].values()}
+    for user_id in range(1, users + 1):
+        record = records[user_id]
+        assert record["is_submitted"]
+        assert (record["energy_score"], record["clarity_score"]) == (4, 2)
+        assert (user_id, user_id) not in conversations
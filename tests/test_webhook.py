@@ -0,0 +1,69 @@
+import asyncio
+import json
+import socket
+
+import httpx
+from telegram.ext import ApplicationBuilder
+
+import main
+from benchmarks.fake_supabase import FakeSupabase, install
+from benchmarks.fake_telegram import FakeBotRequest, message_update
+from persistence import SQLitePersistence
+from webhook import serve_webhook
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_webhook_and_metrics_share_one_port(tmp_path):
+    install(FakeSupabase())
+    bot_request = FakeBotRequest()
+    app = main.build_application(
+        ApplicationBuilder()
+        .token("123456:test")
+        .request(bot_request)
+        .get_updates_request(FakeBotRequest())
+        .persistence(SQLitePersistence(str(tmp_path / "test.sqlite")))
+    )
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+
+    async def run():
+        stop = asyncio.Event()
+        server = asyncio.create_task(
+            serve_webhook(app, port, f"{url}/telegram", "secret", stop)
+        )
+        async with httpx.AsyncClient() as client:
+            for _ in range(100):
+                if app.running:
+                    break
+                await asyncio.sleep(0.01)
+            body = json.dumps(message_update(app.bot, 1, "/help").to_dict())
+            rejected = await client.post(f"{url}/telegram", content=body)
+            accepted = await client.post(
+                f"{url}/telegram",
+                content=body,
+                headers={"X-Telegram-Bot-Api-Secret-Token": "secret"},
+            )
+            for _ in range(100):
+                if bot_request.calls["sendMessage"]:
+                    break
+                await asyncio.sleep(0.01)
+            metrics = await client.get(f"{url}/metrics")
+        stop.set()
+        await server
+        return rejected, accepted, metrics
+
+    rejected, accepted, metrics = asyncio.run(run())
+    assert rejected.status_code == 403
+    assert accepted.status_code == 200
+    assert bot_request.calls["setWebhook"] == 1
+    # The update was handled and answered
+    assert bot_request.calls["sendMessage"] == 1
+    assert metrics.status_code == 200
+    assert 'sleeptracker_handler_seconds_count{handler="help_command"} 1' in (
+        metrics.text
+    )
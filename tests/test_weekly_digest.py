@@ -0,0 +1,24 @@
+import asyncio
+
+import pytest
+
+from benchmarks.weekly_digest import interrupted_run
+
+
+@pytest.mark.parametrize("stop_at", [0.05, 0.5, 0.93])
+def test_digest_resumes_after_a_crash(tmp_path, stop_at):
+    users, group_size = 500, 20
+    result = asyncio.run(
+        interrupted_run(str(tmp_path), users, group_size=group_size, stop_at=stop_at)
+    )
+    messages = result["messages"]
+    assert result["done"]
+    assert sorted(messages) == list(range(1, users + 1))
+    # Only the groups in flight when the first run died are sent again
+    repeated = [user_id for user_id, count in messages.items() if count > 1]
+    assert len(repeated) <= 2 * group_size, repeated
+    assert all(
+        messages[u] == 1 for u in range(1, (result["saved"]["last_user_id"] or 0) + 1)
+    )
+    # A few reads per batch, not one per user
+    assert result["db_requests"] < 20
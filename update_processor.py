@@ -0,0 +1,93 @@
+import asyncio
+import os
+import sys
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Maximum number of updates handled at once, across all users
+UPDATE_CONCURRENCY = int(os.environ.get("UPDATE_CONCURRENCY", "64"))
+
+
+def update_key(update: object) -> tuple | None:
+    """Return the conversation an update belongs to, as ConversationHandler keys it."""
+    if not isinstance(update, Update):
+        return None
+    chat, user = update.effective_chat, update.effective_user
+    if chat is None and user is None:
+        return None
+    return (chat.id if chat else None, user.id if user else None)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Handles different users' updates concurrently and each user's in order.
+
+    Every chat and user pair gets a lock while it has updates in flight, so a
+    conversation never sees two of its updates at once and its state changes
+    happen in the order Telegram sent them. A lock is dropped as soon as its last
+    update is handled. An update only takes one of the `max_concurrent_updates`
+    slots once it holds its lock, so a user sending a burst of updates never
+    holds up anyone else.
+    """
+
+    def __init__(self, max_concurrent_updates: int = UPDATE_CONCURRENCY):
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates must be a positive integer")
+        # process_update takes one of the base class's slots before calling
+        # do_process_update, which an update queued behind its user's previous one
+        # would hold while it waits. Those slots are left unbounded and the limit
+        # is applied below instead
+        super().__init__(sys.maxsize)
+        self._max_concurrent_updates = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._running = 0
+        self._locks: dict[tuple, asyncio.Lock] = {}
+        # Updates holding or waiting for each lock
+        self._pending: dict[tuple, int] = {}
+        self.waited = 0
+
+    @property
+    def current_concurrent_updates(self) -> int:
+        """Number of updates being handled, not counting those waiting their turn."""
+        return self._running
+
+    @property
+    def active_keys(self) -> int:
+        """Number of conversations with updates in flight."""
+        return len(self._locks)
+
+    async def _run(self, coroutine):
+        async with self._slots:
+            self._running += 1
+            try:
+                await coroutine
+            finally:
+                self._running -= 1
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        key = update_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+            self._pending[key] = 0
+        elif lock.locked():
+            self.waited += 1
+        self._pending[key] += 1
+        try:
+            async with lock:
+                await self._run(coroutine)
+        finally:
+            self._pending[key] -= 1
+            if not self._pending[key]:
+                del self._locks[key]
+                del self._pending[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
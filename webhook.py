@@ -0,0 +1,91 @@
+import asyncio
+import json
+import logging
+import signal
+from urllib.parse import urlparse
+
+from telegram import Update
+from telegram.ext import Application
+from tornado.web import Application as WebApplication
+from tornado.web import HTTPError, RequestHandler
+
+from metrics import render_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramHandler(RequestHandler):
+    """Receives the updates Telegram posts to the webhook and queues them."""
+
+    def initialize(self, bot_app: Application, secret_token: str | None):
+        self.bot_app = bot_app
+        self.secret_token = secret_token
+
+    async def post(self):
+        token = self.request.headers.get("X-Telegram-Bot-Api-Secret-Token")
+        if self.secret_token and token != self.secret_token:
+            raise HTTPError(403)
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.bot_app.bot)
+        except (ValueError, TypeError, KeyError):
+            raise HTTPError(400)
+        await self.bot_app.update_queue.put(update)
+
+
+class MetricsHandler(RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(render_metrics())
+
+
+def make_web_app(
+    app: Application, path: str, secret_token: str | None = None
+) -> WebApplication:
+    """The web app serving the webhook at `path` and Prometheus metrics at /metrics."""
+    return WebApplication(
+        [
+            (path, TelegramHandler, {"bot_app": app, "secret_token": secret_token}),
+            (r"/metrics", MetricsHandler),
+        ]
+    )
+
+
+async def serve_webhook(
+    app: Application,
+    port: int,
+    webhook_url: str,
+    secret_token: str | None = None,
+    stop: asyncio.Event | None = None,
+):
+    """Run the bot behind a single web server on `port`, until SIGINT or SIGTERM.
+
+    python-telegram-bot's custom webhook setup: the server puts updates on the
+    application's update_queue, so /metrics can share the webhook's port. Steps
+    follow run_webhook, including the post_init and post_stop hooks.
+    """
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    signals = (signal.SIGINT, signal.SIGTERM)
+    for sig in signals:
+        loop.add_signal_handler(sig, stop.set)
+    path = urlparse(webhook_url).path or "/"
+    server = make_web_app(app, path, secret_token).listen(port)
+    try:
+        async with app:
+            if app.post_init:
+                await app.post_init(app)
+            await app.bot.set_webhook(
+                webhook_url,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            await app.start()
+            logger.info("Serving the webhook and /metrics on port %d", port)
+            await stop.wait()
+            await app.stop()
+            if app.post_stop:
+                await app.post_stop(app)
+    finally:
+        server.stop()
+        for sig in signals:
+            loop.remove_signal_handler(sig)